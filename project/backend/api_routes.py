@@ -1,16 +1,57 @@
-from flask import Blueprint, request, jsonify
-import firebase_admin
-from firebase_admin import auth
-from firebase_config import firebase_auth
-import traceback
+from flask import Blueprint, request, g, current_app, stream_with_context
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import BaseConverter
+from firebase_config import get_auth
+from json_provider import dumps_bytes
+import token_pool
+import orjson
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import re
+import threading
+import time
 
 # Create API Blueprint
 api = Blueprint('api', __name__)
 
+class IdConverter(BaseConverter):
+    """URL segment holding a Firebase uid or Firestore document ID"""
+    regex = r"[A-Za-z0-9_-]{1,128}"
+
+@api.record_once
+def _register_converters(state):
+    # Must run before the blueprint's rules are added to the app's URL map
+    state.app.url_map.converters['id'] = IdConverter
+
 # =============================================================================
 # AUTHENTICATION HELPERS
 # =============================================================================
 
+# Verified ID tokens keyed by sha256(token) -> (uid, exp), so repeat requests
+# with the same token skip the RS256 signature check
+TOKEN_CACHE_TTL = 30
+_token_cache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL)
+_token_cache_lock = threading.RLock()
+
+def verify_id_token_cached(token):
+    """Verify an ID token, reusing a recent verification of the same token"""
+    key = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    
+    # Never serve a cached uid past the token's own expiry
+    if cached and cached[1] > now:
+        return cached[0]
+    
+    decoded = token_pool.verify_id_token(token)
+    if decoded["exp"] > now:
+        with _token_cache_lock:
+            _token_cache[key] = (decoded["uid"], decoded["exp"])
+    return decoded["uid"]
+
 def verify_token():
     """Verify Firebase ID token from Authorization header"""
     try:
@@ -19,30 +60,185 @@ def verify_token():
             return None, {"success": False, "error": "Missing or invalid Authorization header"}, 401
         
         token = auth_header.split(" ")[1]
-        decoded = auth.verify_id_token(token)
-        return decoded["uid"], None, None
+        return verify_id_token_cached(token), None, None
+    except token_pool.VerifierUnavailable as e:
+        # Overload or a restarting pool says nothing about the token, so don't log the user out
+        return None, {"success": False, "error": f"Token verification unavailable: {e}"}, 503
     except Exception as e:
         return None, {"success": False, "error": f"Invalid token: {str(e)}"}, 401
 
-def require_auth(f):
-    """Decorator to require authentication"""
-    def decorated_function(*args, **kwargs):
+# Endpoints that need a verified user; checked once per request in _authenticate
+PROTECTED = frozenset({
+    "api.get_current_user",
+    "api.update_current_user",
+    "api.get_current_user_skills",
+    "api.add_user_skill",
+    "api.remove_user_skill",
+    "api.get_user_swap_requests",
+    "api.get_user_transactions",
+    "api.get_user_reviews",
+    "api.create_swap_request",
+    "api.update_swap_request",
+    "api.get_transaction_details",
+    "api.create_review",
+    "api.create_system_message",
+    "api.admin_get_all_users",
+    "api.admin_ban_user",
+    "api.admin_get_all_requests",
+    "api.admin_clear_cache",
+    "api.get_users_batch",
+})
+
+# Endpoints that take no request body; anything sent is refused unread
+NO_BODY_ENDPOINTS = frozenset({
+    "api.logout",
+    "api.setup_sample_data",
+})
+
+@api.before_request
+def _reject_unexpected_body():
+    """Refuse bodies sent to endpoints that never read one"""
+    if request.endpoint in NO_BODY_ENDPOINTS and request.content_length:
+        return fast_json({"success": False, "error": "This endpoint does not accept a request body"}), 413
+
+@api.before_request
+def _authenticate():
+    """Verify the caller for protected endpoints and expose the uid as g.user_id"""
+    if request.method != "OPTIONS" and request.endpoint in PROTECTED:
         user_id, error, status = verify_token()
         if error:
-            return jsonify(error), status
-        request.user_id = user_id
-        return f(*args, **kwargs)
-    decorated_function.__name__ = f.__name__
-    return decorated_function
+            return fast_json(error), status
+        g.user_id = user_id
+
+def fast_json(obj):
+    """Build a JSON response serialized with orjson"""
+    return current_app.response_class(dumps_bytes(obj), mimetype="application/json")
+
+def wants_ndjson():
+    """Whether the client asked for a newline-delimited JSON stream"""
+    return request.args.get('format') == 'ndjson'
+
+def ndjson_response(rows):
+    """Stream rows as newline-delimited JSON while they are still being fetched"""
+    def generate():
+        for row in rows:
+            yield dumps_bytes(row) + b"\n"
+    return current_app.response_class(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def ndjson_page(iter_rows, *args, **kwargs):
+    """Stream a page as NDJSON; an invalid cursor is refused with 400 before any headers go out"""
+    try:
+        rows = iter_rows(*args, **kwargs)
+    except ValueError as e:
+        return fast_json({"success": False, "error": str(e)}), 400
+    return ndjson_response(rows)
+
+# Largest page a list endpoint will return in one response
+MAX_PAGE_SIZE = 100
+
+def page_args():
+    """Paging options from the query string, with page_size capped at MAX_PAGE_SIZE"""
+    page = {'start_after_id': request.args.get('start_after')}
+    page_size = request.args.get('page_size', type=int)
+    if page_size is not None:
+        page['page_size'] = max(1, min(page_size, MAX_PAGE_SIZE))
+    return page
+
+def json_body():
+    """Parse the JSON request body once per request and reuse it"""
+    if "_json" not in g:
+        try:
+            data = orjson.loads(request.get_data(cache=False) or b"{}")
+        except orjson.JSONDecodeError:
+            data = None
+        g._json = data if isinstance(data, dict) else {}
+    return g._json
+
+# Required JSON fields per write endpoint, checked once in _validate_body
+REQUIRED = {
+    "api.register": (("email", "password", "name"), "Email, password, and name are required"),
+    "api.login": (("email", "password"), "Email and password are required"),
+    "api.update_current_user": ((), None),
+    "api.add_user_skill": (("skill_name", "skill_type"), "Skill name and type are required"),
+    "api.remove_user_skill": (("skill_name", "skill_type"), "Skill name and type are required"),
+    "api.create_swap_request": (("receiver_id", "offered_skill", "requested_skill"),
+                                "Receiver ID, offered skill, and requested skill are required"),
+    "api.update_swap_request": (("status",), "Status is required"),
+    "api.create_review": (("reviewee_id", "transaction_id", "rating", "comment"),
+                          "Reviewee ID, transaction ID, rating, and comment are required"),
+    "api.create_system_message": (("title", "message"), "Title and message are required"),
+    "api.get_users_batch": (("ids",), "User IDs are required"),
+}
+
+@api.before_request
+def _validate_body():
+    """Reject write requests whose JSON body is empty or missing required fields"""
+    rule = REQUIRED.get(request.endpoint)
+    if rule is None or request.method not in ("POST", "PUT"):
+        return None
+    
+    data = json_body()
+    if not data:
+        return fast_json({"success": False, "error": "No data provided"}), 400
+    
+    # Only absent/null/empty-string values count as missing, so 0 and False
+    # are accepted for numeric and boolean fields
+    fields, message = rule
+    for key in fields:
+        value = data.get(key)
+        if value is None or value == "":
+            return fast_json({"success": False, "error": message}), 400
+
+# Read-mostly reference data (skills, system messages, public user lists)
+# served from memory between Firestore reads
+_reference_cache = TTLCache(maxsize=64, ttl=60)
+_reference_cache_lock = threading.Lock()
+
+def cached_result(key, load):
+    """Return a cached successful result for key, calling load() on a miss"""
+    with _reference_cache_lock:
+        result = _reference_cache.get(key)
+    if result is None:
+        result = load()
+        if result.ok:
+            with _reference_cache_lock:
+                _reference_cache[key] = result
+    return result
+
+def invalidate_cached(*keys):
+    """Drop cached reference data so the next read goes to Firestore"""
+    with _reference_cache_lock:
+        if not keys:
+            _reference_cache.clear()
+        for key in keys:
+            _reference_cache.pop(key, None)
+
+def etag_matches(etag):
+    """Whether the request's If-None-Match covers etag (ignoring Flask-Compress suffixes)"""
+    for tag in request.headers.get("If-None-Match", "").split(","):
+        tag = tag.strip().removeprefix("W/").strip('"')
+        # Flask-Compress tags compressed bodies as "<etag>:<algorithm>"
+        if tag == "*" or tag.split(":", 1)[0] == etag:
+            return True
+    return False
+
+def conditional_response(result):
+    """Like handle_response, but ETag-tagged and answered with 304 when unchanged"""
+    if not result.ok:
+        return handle_response(result)
+    
+    body = dumps_bytes(result.data)
+    etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+    if etag_matches(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag, weak=True)
+    return response
 
 def handle_response(result):
-    """Handle standard response format"""
-    if isinstance(result, dict) and 'success' in result:
-        if result['success']:
-            return jsonify(result)
-        else:
-            return jsonify(result), 400
-    return jsonify(result)
+    """Send an ApiResult as its JSON body and status code"""
+    return fast_json(result.data), result.status
 
 # =============================================================================
 # 🔐 AUTHENTICATION ROUTES
@@ -51,162 +247,119 @@ def handle_response(result):
 @api.route("/api/register", methods=["POST"])
 def register():
     """Register a new user"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        email = data.get('email')
-        password = data.get('password')
-        name = data.get('name')
-        location = data.get('location', '')
-        
-        if not all([email, password, name]):
-            return jsonify({"success": False, "error": "Email, password, and name are required"}), 400
-        
-        result = firebase_auth.register_user(email, password, name, location)
-        return handle_response(result)
-        
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    data = json_body()
+    
+    email = data.get('email')
+    password = data.get('password')
+    name = data.get('name')
+    location = data.get('location', '')
+    
+    result = get_auth().register_user(email, password, name, location)
+    return handle_response(result)
 
 @api.route("/api/login", methods=["POST"])
 def login():
     """Login user"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        email = data.get('email')
-        password = data.get('password')
-        
-        if not all([email, password]):
-            return jsonify({"success": False, "error": "Email and password are required"}), 400
-        
-        result = firebase_auth.login_user(email, password)
-        return handle_response(result)
-        
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    data = json_body()
+    
+    email = data.get('email')
+    password = data.get('password')
+    
+    result = get_auth().login_user(email, password)
+    return handle_response(result)
 
 @api.route("/api/logout", methods=["POST"])
 def logout():
     """Logout user (handled client-side)"""
-    return jsonify({"success": True, "message": "Logout successful"})
+    return fast_json({"success": True, "message": "Logout successful"})
 
 # =============================================================================
 # 👤 USER PROFILE ROUTES
 # =============================================================================
 
 @api.route("/api/me", methods=["GET"])
-@require_auth
 def get_current_user():
     """Get current user profile"""
-    try:
-        result = firebase_auth.get_user_profile(request.user_id)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    result = get_auth().get_user_profile(g.user_id)
+    return handle_response(result)
+
+# Profile fields the server maintains; role and bans in particular must never
+# be settable by the user they apply to
+SERVER_PROFILE_FIELDS = frozenset({
+    'user_id', 'email', 'role', 'is_banned', 'ban_reason', 'banned_until',
+    'rating_avg', 'rating_count', 'rating_sum', 'total_swaps', 'successful_swaps',
+    'pending_requests', 'created_at', 'updated_at', 'last_login',
+})
+# Plain top-level names only, so a dotted or `quoted` path can't reach a server field
+PROFILE_FIELD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
 
 @api.route("/api/me/update", methods=["PUT"])
-@require_auth
 def update_current_user():
     """Update current user profile"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        result = firebase_auth.update_user_profile(request.user_id, data)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    data = json_body()
+    
+    refused = sorted(key for key in data if key in SERVER_PROFILE_FIELDS or not PROFILE_FIELD.fullmatch(key))
+    if refused:
+        return fast_json({"success": False, "error": f"Fields cannot be updated: {', '.join(refused)}"}), 400
+    
+    result = get_auth().update_user_profile(g.user_id, data)
+    return handle_response(result)
 
 @api.route("/api/me/skills", methods=["GET"])
-@require_auth
 def get_current_user_skills():
     """Get current user's skills"""
-    try:
-        skill_type = request.args.get('type')  # 'offered' or 'wanted'
-        result = firebase_auth.get_user_skills(request.user_id, skill_type)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    skill_type = request.args.get('type')  # 'offered' or 'wanted'
+    result = get_auth().get_user_skills(g.user_id, skill_type)
+    return handle_response(result)
 
 @api.route("/api/me/skills/add", methods=["POST"])
-@require_auth
 def add_user_skill():
     """Add skill to current user"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        skill_name = data.get('skill_name')
-        skill_type = data.get('skill_type')  # 'offered' or 'wanted'
-        proficiency = data.get('proficiency', 'intermediate')
-        description = data.get('description', '')
-        
-        if not all([skill_name, skill_type]):
-            return jsonify({"success": False, "error": "Skill name and type are required"}), 400
-        
-        result = firebase_auth.add_user_skill(request.user_id, skill_name, skill_type, proficiency, description)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    data = json_body()
+    
+    skill_name = data.get('skill_name')
+    skill_type = data.get('skill_type')  # 'offered' or 'wanted'
+    proficiency = data.get('proficiency', 'intermediate')
+    description = data.get('description', '')
+    
+    result = get_auth().add_user_skill(g.user_id, skill_name, skill_type, proficiency, description)
+    # Adding a skill can create a new catalog entry
+    invalidate_cached("skills")
+    return handle_response(result)
 
 @api.route("/api/me/skills/remove", methods=["POST"])
-@require_auth
 def remove_user_skill():
     """Remove skill from current user"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        skill_name = data.get('skill_name')
-        skill_type = data.get('skill_type')
-        
-        if not all([skill_name, skill_type]):
-            return jsonify({"success": False, "error": "Skill name and type are required"}), 400
-        
-        result = firebase_auth.remove_user_skill(request.user_id, skill_name, skill_type)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    data = json_body()
+    
+    skill_name = data.get('skill_name')
+    skill_type = data.get('skill_type')
+    
+    result = get_auth().remove_user_skill(g.user_id, skill_name, skill_type)
+    return handle_response(result)
 
 @api.route("/api/me/swap-requests", methods=["GET"])
-@require_auth
 def get_user_swap_requests():
     """Get current user's swap requests"""
-    try:
-        request_type = request.args.get('type', 'all')  # 'sent', 'received', 'all'
-        result = firebase_auth.get_user_requests(request.user_id, request_type)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    request_type = request.args.get('type', 'all')  # 'sent', 'received', 'all'
+    if wants_ndjson():
+        return ndjson_page(get_auth().iter_user_requests, g.user_id, request_type, **page_args())
+    
+    result = get_auth().get_user_requests(g.user_id, request_type, **page_args())
+    return handle_response(result)
 
 @api.route("/api/me/transactions", methods=["GET"])
-@require_auth
 def get_user_transactions():
     """Get current user's transactions"""
-    try:
-        result = firebase_auth.get_user_transactions(request.user_id)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    result = get_auth().get_user_transactions(g.user_id, **page_args())
+    return handle_response(result)
 
 @api.route("/api/me/reviews", methods=["GET"])
-@require_auth
 def get_user_reviews():
     """Get reviews for or by current user"""
-    try:
-        as_reviewee = request.args.get('as_reviewee', 'true').lower() == 'true'
-        result = firebase_auth.get_user_reviews(request.user_id, as_reviewee)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    as_reviewee = request.args.get('as_reviewee', 'true').lower() == 'true'
+    result = get_auth().get_user_reviews(g.user_id, as_reviewee, **page_args())
+    return handle_response(result)
 
 # =============================================================================
 # 👥 PUBLIC USER ROUTES
@@ -215,40 +368,69 @@ def get_user_reviews():
 @api.route("/api/users", methods=["GET"])
 def get_public_users():
     """Get list of public users"""
-    try:
-        limit = int(request.args.get('limit', 50))
-        result = firebase_auth.get_public_users(limit)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-
-@api.route("/api/users/<user_id>", methods=["GET"])
+    limit = max(1, min(request.args.get('limit', 50, type=int), MAX_PAGE_SIZE))
+    start_after_id = request.args.get('start_after')
+    if wants_ndjson():
+        return ndjson_page(get_auth().iter_public_users, limit, start_after_id)
+    
+    result = get_auth().get_public_users(limit, start_after_id)
+    return handle_response(result)
+
+# Shared pool so the Firestore reads behind a batch lookup overlap
+_fanout_pool = ThreadPoolExecutor(max_workers=16)
+BATCH_MAX_IDS = 100
+# Same shape the <id:...> URL converter accepts on the single-user routes
+BATCH_ID = re.compile(IdConverter.regex)
+BATCH_LOADERS = {
+    'profile': lambda user_id: get_auth().get_user_profile(user_id).data.get('profile'),
+    'skills': lambda user_id: get_auth().get_user_skills(user_id).data.get('skills'),
+}
+
+@api.route("/api/users/batch", methods=["POST"])
+def get_users_batch():
+    """Get profiles and/or skills for several users in one request"""
+    data = json_body()
+    
+    ids = data.get('ids')
+    include = data.get('include', list(BATCH_LOADERS))
+    
+    if not isinstance(ids, list) or not all(isinstance(user_id, str) and BATCH_ID.fullmatch(user_id) for user_id in ids):
+        return fast_json({"success": False, "error": "ids must be a list of user IDs"}), 400
+    if len(ids) > BATCH_MAX_IDS:
+        return fast_json({"success": False, "error": f"At most {BATCH_MAX_IDS} ids per request"}), 400
+    if (not isinstance(include, list) or not include
+            or not all(isinstance(part, str) for part in include) or not set(include) <= BATCH_LOADERS.keys()):
+        return fast_json({"success": False, "error": "include must list 'profile' and/or 'skills'"}), 400
+    
+    futures = {
+        (user_id, part): _fanout_pool.submit(BATCH_LOADERS[part], user_id)
+        for user_id in dict.fromkeys(ids)
+        for part in include
+    }
+    
+    users = {}
+    for (user_id, part), future in futures.items():
+        users.setdefault(user_id, {})[part] = future.result()
+    
+    return fast_json({"success": True, "users": users})
+
+@api.route("/api/users/<id:user_id>", methods=["GET"])
 def get_user_profile(user_id):
-    """Get public profile of a user"""
-    try:
-        result = firebase_auth.get_user_profile(user_id)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-
-@api.route("/api/users/<user_id>/skills", methods=["GET"])
+    """Get public profile of a user, optionally only ?fields=name,profile_photo"""
+    fields = tuple(f for f in request.args.get('fields', '').split(',') if f) or None
+    # Top-level names only: Firestore would nest a dotted path, while a cached
+    # profile can't, so the response would depend on cache state
+    if fields and not all(PROFILE_FIELD.fullmatch(f) for f in fields):
+        return fast_json({"success": False, "error": "fields must be top-level profile field names"}), 400
+    result = get_auth().get_user_profile(user_id, fields)
+    return conditional_response(result)
+
+@api.route("/api/users/<id:user_id>/skills", methods=["GET"])
 def get_user_skills(user_id):
     """Get a user's skills"""
-    try:
-        skill_type = request.args.get('type')
-        result = firebase_auth.get_user_skills(user_id, skill_type)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-
-@api.route("/api/users/<user_id>/reviews", methods=["GET"])
-def get_user_public_reviews(user_id):
-    """Get reviews for a user"""
-    try:
-        result = firebase_auth.get_user_reviews(user_id, as_reviewee=True)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    skill_type = request.args.get('type')
+    result = get_auth().get_user_skills(user_id, skill_type)
+    return conditional_response(result)
 
 # =============================================================================
 # 🧠 SKILLS ROUTES
@@ -257,122 +439,92 @@ def get_user_public_reviews(user_id):
 @api.route("/api/skills", methods=["GET"])
 def get_all_skills():
     """Get all available skills"""
-    try:
-        result = firebase_auth.get_all_skills()
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    if wants_ndjson():
+        return ndjson_response(get_auth().iter_all_skills())
+    
+    result = cached_result("skills", get_auth().get_all_skills)
+    return conditional_response(result)
 
 @api.route("/api/skills/search", methods=["GET"])
 def search_skills():
     """Search skills"""
-    try:
-        query = request.args.get('query', '')
-        category = request.args.get('category')
-        
-        if not query:
-            return jsonify({"success": False, "error": "Query parameter is required"}), 400
-        
-        result = firebase_auth.search_skills(query, category)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    query = request.args.get('query', '')
+    category = request.args.get('category')
+    
+    if not query:
+        return fast_json({"success": False, "error": "Query parameter is required"}), 400
+    
+    result = get_auth().search_skills(query, category, **page_args())
+    return handle_response(result)
+
+@api.route("/api/skills/<skill_id>/counts", methods=["GET"])
+def get_skill_counts(skill_id):
+    """Get live offering/wanting counts for a skill"""
+    result = get_auth().get_skill_counts(skill_id)
+    return handle_response(result)
 
 # =============================================================================
 # 🔁 SWAP REQUEST ROUTES
 # =============================================================================
 
 @api.route("/api/swap-requests", methods=["POST"])
-@require_auth
 def create_swap_request():
     """Create a new skill swap request"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        receiver_id = data.get('receiver_id')
-        offered_skill = data.get('offered_skill')
-        requested_skill = data.get('requested_skill')
-        message = data.get('message', '')
-        
-        if not all([receiver_id, offered_skill, requested_skill]):
-            return jsonify({"success": False, "error": "Receiver ID, offered skill, and requested skill are required"}), 400
-        
-        result = firebase_auth.create_barter_request(request.user_id, receiver_id, offered_skill, requested_skill, message)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-
-@api.route("/api/swap-requests/<request_id>/update", methods=["PUT"])
-@require_auth
+    data = json_body()
+    
+    receiver_id = data.get('receiver_id')
+    offered_skill = data.get('offered_skill')
+    requested_skill = data.get('requested_skill')
+    message = data.get('message', '')
+    
+    result = get_auth().create_barter_request(g.user_id, receiver_id, offered_skill, requested_skill, message)
+    return handle_response(result)
+
+@api.route("/api/swap-requests/<id:request_id>/update", methods=["PUT"])
 def update_swap_request(request_id):
     """Accept/reject/cancel swap request"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        status = data.get('status')  # 'accepted', 'rejected', 'cancelled'
-        response_message = data.get('response_message', '')
-        
-        if not status:
-            return jsonify({"success": False, "error": "Status is required"}), 400
-        
-        result = firebase_auth.update_request_status(request_id, status, response_message)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    data = json_body()
+    
+    status = data.get('status')  # 'accepted', 'rejected', 'cancelled'
+    response_message = data.get('response_message', '')
+    
+    result = get_auth().update_request_status(request_id, status, response_message, g.user_id)
+    return handle_response(result)
 
 # =============================================================================
 # 💳 TRANSACTION ROUTES
 # =============================================================================
 
-@api.route("/api/transactions/<transaction_id>", methods=["GET"])
-@require_auth
+@api.route("/api/transactions/<id:transaction_id>", methods=["GET"])
 def get_transaction_details(transaction_id):
     """Get details of a transaction"""
-    try:
-        # This would need to be implemented in the database class
-        return jsonify({"success": False, "error": "Transaction details endpoint not implemented"}), 501
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    # This would need to be implemented in the database class
+    return fast_json({"success": False, "error": "Transaction details endpoint not implemented"}), 501
 
 # =============================================================================
 # ⭐ REVIEW ROUTES
 # =============================================================================
 
 @api.route("/api/reviews", methods=["POST"])
-@require_auth
 def create_review():
     """Create a new review"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        reviewee_id = data.get('reviewee_id')
-        transaction_id = data.get('transaction_id')
-        rating = data.get('rating')
-        comment = data.get('comment')
-        title = data.get('title', '')
-        
-        if not all([reviewee_id, transaction_id, rating, comment]):
-            return jsonify({"success": False, "error": "Reviewee ID, transaction ID, rating, and comment are required"}), 400
-        
-        result = firebase_auth.create_review(request.user_id, reviewee_id, transaction_id, rating, comment, title)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-
-@api.route("/api/reviews/<user_id>", methods=["GET"])
+    data = json_body()
+    
+    reviewee_id = data.get('reviewee_id')
+    transaction_id = data.get('transaction_id')
+    rating = data.get('rating')
+    comment = data.get('comment')
+    title = data.get('title', '')
+    
+    result = get_auth().create_review(g.user_id, reviewee_id, transaction_id, rating, comment, title)
+    return handle_response(result)
+
+@api.route("/api/reviews/<id:user_id>", methods=["GET"])
+@api.route("/api/users/<id:user_id>/reviews", methods=["GET"])
 def get_public_reviews(user_id):
     """Get public reviews for a user"""
-    try:
-        result = firebase_auth.get_user_reviews(user_id, as_reviewee=True)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    result = get_auth().get_user_reviews(user_id, as_reviewee=True, **page_args())
+    return conditional_response(result)
 
 # =============================================================================
 # 📣 SYSTEM MESSAGE ROUTES
@@ -381,66 +533,56 @@ def get_public_reviews(user_id):
 @api.route("/api/system-messages", methods=["GET"])
 def get_system_messages():
     """Get active system messages"""
-    try:
-        result = firebase_auth.get_active_messages()
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    result = cached_result("active_messages", get_auth().get_active_messages)
+    return handle_response(result)
 
 @api.route("/api/system-messages/create", methods=["POST"])
-@require_auth
 def create_system_message():
     """Create system message (admin only)"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"success": False, "error": "No data provided"}), 400
-        
-        title = data.get('title')
-        message = data.get('message')
-        message_type = data.get('message_type', 'announcement')
-        
-        if not all([title, message]):
-            return jsonify({"success": False, "error": "Title and message are required"}), 400
-        
-        result = firebase_auth.create_system_message(request.user_id, title, message, message_type)
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    data = json_body()
+    
+    title = data.get('title')
+    message = data.get('message')
+    message_type = data.get('message_type', 'announcement')
+    
+    result = get_auth().create_system_message(g.user_id, title, message, message_type)
+    invalidate_cached("active_messages")
+    return handle_response(result)
 
 # =============================================================================
 # 🛡️ ADMIN ROUTES (Placeholder implementations)
 # =============================================================================
 
 @api.route("/api/admin/users", methods=["GET"])
-@require_auth
 def admin_get_all_users():
     """Admin: List all users"""
-    try:
-        # This would need admin permission check and implementation in database class
-        return jsonify({"success": False, "error": "Admin users endpoint not implemented"}), 501
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    # This would need admin permission check and implementation in database class
+    return fast_json({"success": False, "error": "Admin users endpoint not implemented"}), 501
 
-@api.route("/api/admin/users/<user_id>/ban", methods=["PUT"])
-@require_auth
+@api.route("/api/admin/users/<id:user_id>/ban", methods=["PUT"])
 def admin_ban_user(user_id):
     """Admin: Ban or unban user"""
-    try:
-        # This would need admin permission check and implementation in database class
-        return jsonify({"success": False, "error": "Admin ban user endpoint not implemented"}), 501
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    # This would need admin permission check and implementation in database class
+    return fast_json({"success": False, "error": "Admin ban user endpoint not implemented"}), 501
 
 @api.route("/api/admin/swap-requests", methods=["GET"])
-@require_auth
 def admin_get_all_requests():
     """Admin: View all swap requests"""
-    try:
-        # This would need admin permission check and implementation in database class
-        return jsonify({"success": False, "error": "Admin swap requests endpoint not implemented"}), 501
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    # This would need admin permission check and implementation in database class
+    return fast_json({"success": False, "error": "Admin swap requests endpoint not implemented"}), 501
+
+@api.route("/api/admin/cache/clear", methods=["POST"])
+def admin_clear_cache():
+    """Admin: Drop cached skills, searches, profiles, system messages and public user lists"""
+    # Caches are per process: this clears only the worker that handles the
+    # request, and the others catch up as their TTLs (at most 5 min) expire
+    result = get_auth().get_user_profile(g.user_id, ('role',))
+    if not result.ok or result.data['profile'].get('role') != 'admin':
+        return fast_json({"success": False, "error": "Admin access required"}), 403
+    
+    invalidate_cached()
+    get_auth().clear_caches()
+    return fast_json({"success": True, "message": "Cache cleared"})
 
 # =============================================================================
 # 🔧 SETUP ROUTES
@@ -449,11 +591,9 @@ def admin_get_all_requests():
 @api.route("/api/setup/sample-data", methods=["POST"])
 def setup_sample_data():
     """Setup sample data for testing"""
-    try:
-        result = firebase_auth.setup_sample_data()
-        return handle_response(result)
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    result = get_auth().setup_sample_data()
+    invalidate_cached("skills", "active_messages")
+    return handle_response(result)
 
 # =============================================================================
 # ERROR HANDLERS
@@ -461,12 +601,23 @@ def setup_sample_data():
 
 @api.errorhandler(404)
 def not_found(error):
-    return jsonify({"success": False, "error": "Endpoint not found"}), 404
+    return fast_json({"success": False, "error": "Endpoint not found"}), 404
 
 @api.errorhandler(405)
 def method_not_allowed(error):
-    return jsonify({"success": False, "error": "Method not allowed"}), 405
+    return fast_json({"success": False, "error": "Method not allowed"}), 405
+
+@api.errorhandler(413)
+def payload_too_large(error):
+    return fast_json({"success": False, "error": "Request body too large"}), 413
 
 @api.errorhandler(500)
 def internal_error(error):
-    return jsonify({"success": False, "error": "Internal server error"}), 500
\ No newline at end of file
+    return fast_json({"success": False, "error": "Internal server error"}), 500
+
+@api.errorhandler(Exception)
+def unhandled_exception(error):
+    if isinstance(error, HTTPException):
+        return error
+    current_app.logger.exception("Unhandled error in %s", request.endpoint)
+    return fast_json({"success": False, "error": type(error).__name__}), 500
\ No newline at end of file
@@ -1,27 +1,75 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from flask_compress import Compress
 import firebase_admin
 from firebase_admin import auth
+import logging
 import os
 from dotenv import load_dotenv
-from firebase_config import firebase_auth
+from firebase_config import get_auth
 from api_routes import api
+from json_provider import OrjsonProvider
 
 # Load environment variables
 load_dotenv()
 
-def create_app():
+log = logging.getLogger(__name__)
+
+# The static part of the preflight answer is precomputed; the Max-Age lets
+# browsers skip repeat preflights for a day
+PREFLIGHT_HEADERS = (
+    ("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS"),
+    ("Access-Control-Max-Age", "86400"),
+    ("Vary", "Origin, Access-Control-Request-Headers"),
+)
+
+def create_app(firestore_client=None):
     """Create and configure Flask application"""
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    
+    # API payloads are small JSON objects; werkzeug refuses anything larger
+    # before it is buffered
+    app.config["MAX_CONTENT_LENGTH"] = 64 * 1024
     
     # Enable CORS for all routes (development-safe)
     CORS(app, origins="*", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
     
-    # Initialize Firebase Auth
-    if not firebase_auth.initialize():
-        print("❌ Failed to initialize Firebase Auth")
+    @app.before_request
+    def answer_preflight():
+        # Only real CORS preflights; other OPTIONS requests get Flask's usual answer
+        origin = request.headers.get("Origin")
+        if request.method == "OPTIONS" and origin and "Access-Control-Request-Method" in request.headers:
+            # Echo the origin and requested headers like flask-cors does, so
+            # credentialed requests and any custom header keep working
+            response = app.response_class(status=204, headers=PREFLIGHT_HEADERS)
+            response.headers["Access-Control-Allow-Origin"] = origin
+            requested_headers = request.headers.get("Access-Control-Request-Headers")
+            if requested_headers:
+                response.headers["Access-Control-Allow-Headers"] = requested_headers
+            return response
+    
+    # Compress JSON responses; list payloads shrink several-fold
+    app.config["COMPRESS_MIMETYPES"] = ["application/json"]
+    app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+    app.config["COMPRESS_MIN_SIZE"] = 512
+    app.config["COMPRESS_LEVEL"] = 4
+    app.config["COMPRESS_BR_LEVEL"] = 4
+    Compress(app)
+    
+    # Initialize Firebase Auth; looked up here rather than at import, so a
+    # fake can be installed before the app is built
+    firebase_auth = get_auth()
+    if not firebase_auth.initialize(firestore_client):
+        log.error("Failed to initialize Firebase Auth")
         return None
     
+    # Warm the token signing certs so the first authed request skips the fetch
+    firebase_auth.preload_token_certs()
+    
+    # One Firestore client, and so one pooled gRPC channel, serves every request
+    app.extensions["firestore"] = firebase_auth.db_manager.db
+    
     # Register API blueprint
     app.register_blueprint(api)
     
@@ -44,13 +92,3 @@ def create_app():
         })
     
     return app
-
-if __name__ == "__main__":
-    app = create_app()
-    if app:
-        print("🚀 Starting SkillSwap API Server...")
-        print("📡 API endpoints available at: http://localhost:5000/api/*")
-        print("🔧 Health check: http://localhost:5000/health")
-        app.run(debug=True, host="0.0.0.0", port=5000)
-    else:
-        print("❌ Failed to create Flask application")
\ No newline at end of file
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+SkillSwap ASGI entrypoint
+Serve with: uvicorn asgi:app --workers 4
+"""
+
+import os
+from a2wsgi import WSGIMiddleware
+from app import create_app
+import token_pool
+
+flask_app = create_app()
+
+if not flask_app:
+    raise RuntimeError("Failed to create Flask application")
+
+# Spawn the token verifier processes now rather than on the first authed request
+token_pool.warm()
+
+# Each request runs on this thread pool, so one event loop keeps accepting
+# connections while handlers block on Firestore
+app = WSGIMiddleware(flask_app, workers=int(os.getenv("ASGI_THREADS", 32)))
@@ -1,32 +1,225 @@
+import logging
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.field_path import FieldPath
 import requests
-import json
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import os
+import random
+from datetime import datetime, timedelta, timezone
+import threading
 import uuid
+from cachetools import TTLCache
 
+log = logging.getLogger(__name__)
+
+# Deadlines are stored as aware UTC datetimes
+_UTC = timezone.utc
+_SEVEN_DAYS = timedelta(days=7)
+_TWO_WEEKS = timedelta(weeks=2)
+
+# Firestore caps a WriteBatch at 500 operations
+BATCH_LIMIT = 500
+
+# Longest prefix indexed for skill search, and most results returned
+SEARCH_PREFIX_LEN = 20
+SEARCH_LIMIT = 50
+SEARCH_TIMEOUT = 2
+
+# Each skill's offering/wanting counters are spread over this many shard
+# documents so popular skills are not capped at one write per second
+SKILL_COUNTER_SHARDS = 10
+
+# In-process caches for hot reads: known skill IDs, user profiles, the skills list
+SKILL_CACHE_TTL = 300
+PROFILE_CACHE_TTL = 60
+
+# Default page size for list queries, newest first. Pages are addressed by
+# the ID of the last document seen, never by offset: Firestore bills every
+# document an offset skips, so deep offset pages cost offset + size reads.
+PAGE_SIZE = 25
+
+# Fields list queries project by default, so listings skip the rest of each document
+PUBLIC_USER_FIELDS = ('name', 'location', 'profile_photo', 'availability', 'rating_avg', 'rating_count', 'total_swaps')
+SKILL_LIST_FIELDS = ('skill_id', 'name', 'description', 'category', 'users_offering', 'users_wanting')
+REQUEST_LIST_FIELDS = ('sender_id', 'receiver_id', 'offered_skill_name', 'requested_skill_name', 'message',
+                       'status', 'response_message', 'transaction_id', 'created_at', 'expires_at')
+
+# Which side of a pending barter request may move it to each status
+REQUEST_RESPONDERS = {'accepted': 'receiver_id', 'rejected': 'receiver_id', 'cancelled': 'sender_id'}
+
+# Characters a skill name maps to '_' in its document ID ('/' would split the path)
+_SLUG_TBL = str.maketrans({' ': '_', '-': '_', '/': '_'})
+
+def _slug(name):
+    """Skill document ID for a skill name"""
+    return name.lower().translate(_SLUG_TBL)
+
+def _search_prefixes(name):
+    """Prefixes of a skill name and of each word in it, for array-contains search"""
+    name_lower = name.lower()
+    prefixes = set()
+    for term in [name_lower] + name_lower.split():
+        prefixes.update(term[:i] for i in range(1, min(len(term), SEARCH_PREFIX_LEN) + 1))
+    return sorted(prefixes)
+
+def _field_paths(updates, parents=()):
+    """Flatten nested maps into field paths, so update() sets only the leaves"""
+    paths = {}
+    for key, value in updates.items():
+        parts = parents + (key,)
+        if isinstance(value, dict) and value:
+            paths.update(_field_paths(value, parts))
+        else:
+            # Each segment is quoted as needed, so a key like 'example.com' stays one level
+            paths[FieldPath(*parts).to_api_repr()] = value
+    return paths
+
+def _skill_data(name, description, category="General", created_by="system"):
+    """Build a new Skills document"""
+    return {
+        'skill_id': _slug(name),
+        'name': name,
+        'name_lower': name.lower(),
+        'name_prefixes': _search_prefixes(name),
+        'description': description,
+        'category': category,
+        'subcategory': '',
+        'tags': [],
+        'users_offering': 0,
+        'users_wanting': 0,
+        'total_swaps': 0,
+        'popularity_score': 0.0,
+        'is_approved': True,
+        'is_flagged': False,
+        'flag_count': 0,
+        'created_by': created_by,
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }
+
+def _system_message_data(admin_id, title, message, message_type="announcement"):
+    """Build a new system_messages document"""
+    return {
+        'admin_id': admin_id,
+        'admin_name': 'Admin',  # Get from user profile
+        'title': title,
+        'message': message,
+        'type': message_type,  # announcement, maintenance, feature_update, warning
+        'priority': 'normal',  # low, normal, high, urgent
+        'target_audience': 'all',  # all, users, admins, specific
+        'target_user_ids': [],
+        'target_roles': ['user'],
+        'is_active': True,
+        'is_dismissible': True,
+        'show_until': datetime.now(_UTC) + _SEVEN_DAYS,
+        'display_location': 'banner',  # banner, modal, notification
+        'view_count': 0,
+        'dismissal_count': 0,
+        'click_count': 0,
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+        'published_at': firestore.SERVER_TIMESTAMP
+    }
+
+# Seed skills for setup_sample_data, built once at import; the timestamp
+# sentinels are resolved by Firestore on each write
+_SAMPLE_SKILL_PAYLOADS = tuple(_skill_data(name, description, category) for name, description, category in (
+    ('JavaScript Programming', 'Modern JavaScript development', 'Programming'),
+    ('Python Programming', 'Python for web development and data science', 'Programming'),
+    ('Graphic Design', 'Visual design and branding', 'Design'),
+    ('Photography', 'Digital photography and editing', 'Creative'),
+    ('Spanish Language', 'Conversational and business Spanish', 'Languages'),
+    ('Guitar Playing', 'Acoustic and electric guitar', 'Music'),
+    ('Cooking', 'International cuisine and baking', 'Lifestyle'),
+    ('Digital Marketing', 'Social media and online marketing', 'Business'),
+    ('Data Science', 'Data analysis and machine learning', 'Programming'),
+    ('UI/UX Design', 'User interface and experience design', 'Design'),
+))
 
 
 class SkillSwapDatabase:
+    """Firestore data access; one per process, as it owns the client, HTTP session and caches"""
+    
     def __init__(self, firebase_config):
         self.db = None
         self.initialized = False
         self.api_key = firebase_config["apiKey"]
+        self.http = self._http_session()
+        self._cache_lock = threading.Lock()
+        self._skill_cache = TTLCache(maxsize=1024, ttl=SKILL_CACHE_TTL)
+        self._profile_cache = TTLCache(maxsize=10000, ttl=PROFILE_CACHE_TTL)
+        self._skills_list_cache = TTLCache(maxsize=8, ttl=SKILL_CACHE_TTL)
+        self._search_cache = TTLCache(maxsize=1024, ttl=SKILL_CACHE_TTL)
+        self.search_index = self._search_index()
         
-    def initialize(self):
-        """Initialize Firebase Admin SDK"""
+    def _http_session(self):
+        """Keep-alive HTTP session shared by every REST call this process makes"""
+        session = requests.Session()
+        # Connection failures are retried for any method; 5xx only for
+        # idempotent ones, since a repeated sign-up POST is not harmless
+        retries = Retry(total=2, backoff_factor=0.1, status_forcelist=(500, 502, 503, 504))
+        session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retries))
+        return session
+    
+    def _search_index(self):
+        """Typesense client for skill search, or None to search Firestore directly"""
+        if not (os.getenv("TYPESENSE_HOST") and os.getenv("TYPESENSE_API_KEY")):
+            return None
+        
+        # Imported here so deployments without Typesense never pay for loading it
+        import typesense
+        return typesense.Client({
+            'nodes': [{
+                'host': os.getenv("TYPESENSE_HOST"),
+                'port': os.getenv("TYPESENSE_PORT", "443"),
+                'protocol': os.getenv("TYPESENSE_PROTOCOL", "https")
+            }],
+            'api_key': os.getenv("TYPESENSE_API_KEY"),
+            'connection_timeout_seconds': SEARCH_TIMEOUT
+        })
+    
+    def _forget_profiles(self, *user_ids):
+        """Drop cached profiles after their documents change"""
+        with self._cache_lock:
+            for user_id in user_ids:
+                self._profile_cache.pop(user_id, None)
+    
+    def _forget_skills(self):
+        """Drop the cached skills list and search results after skills are written"""
+        with self._cache_lock:
+            self._skills_list_cache.clear()
+            self._search_cache.clear()
+    
+    def clear_caches(self):
+        """Drop every cached profile, skill and skill list held by this process"""
+        with self._cache_lock:
+            self._skill_cache.clear()
+            self._profile_cache.clear()
+            self._skills_list_cache.clear()
+            self._search_cache.clear()
+    
+    def initialize(self, client=None):
+        """Initialize Firebase Admin SDK, or adopt an already-built Firestore client"""
         try:
-            if not firebase_admin._apps:
-                cred = credentials.Certificate("firebase-credentials.json")
-                firebase_admin.initialize_app(cred)
+            if client is None:
+                if not firebase_admin._apps:
+                    cred = credentials.Certificate("firebase-credentials.json")
+                    firebase_admin.initialize_app(cred)
+                
+                # firestore.client() is memoized per Firebase app, so every
+                # caller shares one client and one gRPC channel, which the
+                # SDK already opens with a 30s keepalive
+                client = firestore.client()
             
-            self.db = firestore.client()
+            self.db = client
             self.initialized = True
-            print(" Database initialized successfully")
+            log.info("Database initialized")
             return True
             
         except Exception as e:
-            print(f" Database initialization failed: {e}")
+            log.error("Database initialization failed: %s", e)
             return False
 
    
@@ -50,6 +243,7 @@ class SkillSwapDatabase:
                 'banned_until': None,
                 'rating_avg': 0.0,
                 'rating_count': 0,
+                'rating_sum': 0,
                 'total_swaps': 0,
                 'successful_swaps': 0,
                 'pending_requests': 0,
@@ -59,41 +253,98 @@ class SkillSwapDatabase:
             }
             
             self.db.collection('users').document(user_id).set(user_data)
+            self._forget_profiles(user_id)
             return {'success': True, 'message': 'User profile created'}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_user_profile(self, user_id):
-        """Get user profile"""
+    def get_user_profile(self, user_id, fields=None):
+        """Get user profile, or only the given top-level fields of it"""
         try:
-            doc = self.db.collection('users').document(user_id).get()
-            if doc.exists:
-                return {'success': True, 'profile': doc.to_dict()}
-            else:
-                return {'success': False, 'error': 'User not found'}
+            with self._cache_lock:
+                profile = self._profile_cache.get(user_id)
+            if profile is None:
+                doc_ref = self.db.collection('users').document(user_id)
+                if fields:
+                    # Partial reads are projected by Firestore and left out of the full-profile cache
+                    doc = doc_ref.get(field_paths=list(fields))
+                    if not doc.exists:
+                        return {'success': False, 'error': 'User not found'}
+                    return {'success': True, 'profile': doc.to_dict()}
+                doc = doc_ref.get()
+                if not doc.exists:
+                    return {'success': False, 'error': 'User not found'}
+                profile = doc.to_dict()
+                with self._cache_lock:
+                    self._profile_cache[user_id] = profile
+            
+            if fields:
+                return {'success': True, 'profile': {f: profile[f] for f in fields if f in profile}}
+            return {'success': True, 'profile': dict(profile)}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
     def update_user_profile(self, user_id, updates):
-        """Update user profile"""
+        """Update only the given profile fields; nested maps are merged, not replaced"""
         try:
+            updates = _field_paths(updates)
             updates['updated_at'] = firestore.SERVER_TIMESTAMP
             self.db.collection('users').document(user_id).update(updates)
+            self._forget_profiles(user_id)
             return {'success': True, 'message': 'Profile updated'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_public_users(self, limit=50):
-        """Get all public user profiles"""
+    def _cursor(self, collection, doc_id):
+        """Snapshot of the document a page should continue after"""
+        if doc_id is None:
+            return None
+        snapshot = self.db.collection(collection).document(doc_id).get()
+        if not snapshot.exists:
+            raise ValueError('Invalid page cursor')
+        return snapshot
+    
+    def _paginate(self, query, cursor, size):
+        """Order a query newest first and bound it to the page after cursor (never use offset)"""
+        query = query.order_by('created_at', direction=firestore.Query.DESCENDING)
+        if cursor is not None:
+            query = query.start_after(cursor)
+        return query.limit(size)
+    
+    def _next_cursor(self, rows, id_field, size):
+        """ID to pass as start_after_id for the next page, or None on the last page"""
+        return rows[-1][id_field] if len(rows) == size else None
+    
+    def record_login(self, user_id):
+        """Stamp last_login without evicting the cached profile a login just loaded"""
+        try:
+            self.db.collection('users').document(user_id).update({'last_login': firestore.SERVER_TIMESTAMP})
+            return {'success': True}
+        except Exception as e:
+            # Runs in the background, so nobody else sees the result
+            log.warning("last_login update failed for %s: %s", user_id, e)
+            return {'success': False, 'error': str(e)}
+    
+    def _stream(self, query, id_field):
+        """Yield each document's data, with its ID under id_field, as it streams from Firestore"""
+        for doc in query.stream():
+            row = doc.to_dict()
+            row[id_field] = doc.id
+            yield row
+    
+    def iter_public_users(self, limit=50, start_after_id=None, fields=None):
+        """Stream public user profiles; a bad cursor raises here, before the first row"""
+        users_ref = self.db.collection('users').where('profile_visibility', '==', 'public').where('is_banned', '==', False)
+        users_ref = users_ref.select(list(fields or PUBLIC_USER_FIELDS))
+        cursor = self._cursor('users', start_after_id)
+        return self._stream(self._paginate(users_ref, cursor, limit), 'user_id')
+    
+    def get_public_users(self, limit=50, start_after_id=None, fields=None):
+        """Get a page of public user profiles"""
         try:
-            users_ref = self.db.collection('users').where('profile_visibility', '==', 'public').where('is_banned', '==', False).limit(limit)
-            users = []
-            for doc in users_ref.stream():
-                user_data = doc.to_dict()
-                user_data['user_id'] = doc.id
-                users.append(user_data)
-            return {'success': True, 'users': users}
+            users = list(self.iter_public_users(limit, start_after_id, fields))
+            return {'success': True, 'users': users, 'next_cursor': self._next_cursor(users, 'user_id', limit)}
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
@@ -103,58 +354,137 @@ class SkillSwapDatabase:
     def create_skill(self, name, description, category="General", created_by="system"):
         """Create a skill in Skills collection"""
         try:
-            skill_id = name.lower().replace(' ', '_').replace('-', '_')
-            skill_data = {
-                'skill_id': skill_id,
-                'name': name,
-                'description': description,
-                'category': category,
-                'subcategory': '',
-                'tags': [],
-                'users_offering': 0,
-                'users_wanting': 0,
-                'total_swaps': 0,
-                'popularity_score': 0.0,
-                'is_approved': True,
-                'is_flagged': False,
-                'flag_count': 0,
-                'created_by': created_by,
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'updated_at': firestore.SERVER_TIMESTAMP
-            }
+            skill_data = _skill_data(name, description, category, created_by)
+            skill_id = skill_data['skill_id']
             
             self.db.collection('skills').document(skill_id).set(skill_data)
+            with self._cache_lock:
+                self._skill_cache[skill_id] = True
+                self._skills_list_cache.clear()
+                self._search_cache.clear()
             return {'success': True, 'skill_id': skill_id}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_all_skills(self):
+    def iter_all_skills(self, fields=None):
+        """Yield approved skills as they stream from Firestore"""
+        skills_ref = self.db.collection('skills').where('is_approved', '==', True).where('is_flagged', '==', False)
+        for doc in skills_ref.select(list(fields or SKILL_LIST_FIELDS)).stream():
+            yield doc.to_dict()
+    
+    def get_all_skills(self, fields=None):
         """Get all approved skills"""
         try:
-            skills_ref = self.db.collection('skills').where('is_approved', '==', True).where('is_flagged', '==', False)
-            skills = []
-            for doc in skills_ref.stream():
-                skill_data = doc.to_dict()
-                skills.append(skill_data)
-            return {'success': True, 'skills': skills}
+            key = ('all_skills', tuple(fields or SKILL_LIST_FIELDS))
+            with self._cache_lock:
+                skills = self._skills_list_cache.get(key)
+            if skills is None:
+                skills = list(self.iter_all_skills(fields))
+                with self._cache_lock:
+                    self._skills_list_cache[key] = skills
+            
+            return {'success': True, 'skills': list(skills)}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def search_skills(self, query, category=None):
-        """Search skills by name or category"""
+    def search_skills(self, query, category=None, fields=None, page_size=SEARCH_LIMIT, start_after_id=None):
+        """Search skills, reusing recent results for the same normalized query (typeahead repeats a lot)"""
+        # Typesense has no escape for backticks, so one could close the quoted
+        # category and add clauses of its own (e.g. drop the is_approved filter)
+        if category is not None and '`' in category:
+            return {'success': False, 'error': 'Invalid category'}
+        
+        term = query.strip().lower()
+        key = (term, category, tuple(fields or SKILL_LIST_FIELDS), page_size, start_after_id)
+        with self._cache_lock:
+            result = self._search_cache.get(key)
+        if result is None:
+            result = self._search_skills(term, category, fields, page_size, start_after_id)
+            if result['success']:
+                with self._cache_lock:
+                    self._search_cache[key] = result
+        
+        return {**result, 'skills': list(result['skills'])} if result['success'] else result
+    
+    def _search_skills(self, query, category, fields, page_size, start_after_id):
+        """Search skills through Typesense when configured, else by name prefix in Firestore"""
+        if self.search_index is not None and start_after_id is None:
+            try:
+                return {'success': True, 'skills': self._search_skills_index(query, category, fields, page_size),
+                        'next_cursor': None}
+            except Exception as e:
+                log.warning("Skill search index unavailable, using Firestore: %s", e)
+        
+        return self._search_skills_firestore(query, category, fields, page_size, start_after_id)
+    
+    def _search_skills_index(self, query, category=None, fields=None, page_size=SEARCH_LIMIT):
+        """Full-text skill search against the Typesense mirror of the skills collection"""
+        filters = 'is_approved:=true'
+        if category is not None:
+            filters += f' && category:=`{category}`'
+        
+        result = self.search_index.collections[os.getenv("TYPESENSE_COLLECTION", "skills")].documents.search({
+            'q': query,
+            'query_by': 'name,description,category',
+            'filter_by': filters,
+            'include_fields': ','.join(fields or SKILL_LIST_FIELDS),
+            'per_page': page_size
+        })
+        return [hit['document'] for hit in result['hits']]
+    
+    def _search_skills_firestore(self, query, category=None, fields=None, page_size=SEARCH_LIMIT, start_after_id=None):
+        """Search skills by name prefix (whole name or any word) and category, one page at a time"""
         try:
-            skills_ref = self.db.collection('skills').where('is_approved', '==', True)
+            term = query.strip().lower()
+            fields = list(fields or SKILL_LIST_FIELDS)
+            skills_ref = (self.db.collection('skills')
+                          .where('name_prefixes', 'array_contains', term[:SEARCH_PREFIX_LEN])
+                          .where('is_approved', '==', True)
+                          .select(sorted(set(fields) | {'name_lower'})))
+            if category is not None:
+                skills_ref = skills_ref.where('category', '==', category)
+            # Equality/array_contains matches come back in document ID order, so the
+            # cursor needs no extra order_by or composite index
+            cursor = self._cursor('skills', start_after_id)
+            if cursor is not None:
+                skills_ref = skills_ref.start_after(cursor)
             
             skills = []
-            for doc in skills_ref.stream():
+            docs = list(skills_ref.limit(page_size).stream())
+            for doc in docs:
                 skill_data = doc.to_dict()
-                # Simple text search
-                if query.lower() in skill_data['name'].lower():
-                    if category is None or skill_data.get('category') == category:
-                        skills.append(skill_data)
-            
-            return {'success': True, 'skills': skills}
+                # Only terms longer than the indexed prefixes need re-checking
+                if len(term) <= SEARCH_PREFIX_LEN or term in skill_data['name_lower']:
+                    if 'name_lower' not in fields:
+                        del skill_data['name_lower']
+                    skills.append(skill_data)
+            
+            # Cursor on the last document read, not the last kept, so re-checked misses aren't re-read
+            next_cursor = docs[-1].id if len(docs) == page_size else None
+            return {'success': True, 'skills': skills, 'next_cursor': next_cursor}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def backfill_skill_search_fields(self):
+        """Add name_lower/name_prefixes to skills written before search used them"""
+        try:
+            batch = self.db.batch()
+            updated = 0
+            for doc in self.db.collection('skills').stream():
+                skill_data = doc.to_dict()
+                if 'name_prefixes' in skill_data:
+                    continue
+                batch.update(doc.reference, {
+                    'name_lower': skill_data['name'].lower(),
+                    'name_prefixes': _search_prefixes(skill_data['name'])
+                })
+                updated += 1
+                if updated % BATCH_LIMIT == 0:
+                    batch.commit()
+                    batch = self.db.batch()
+            batch.commit()
+            return {'success': True, 'updated': updated}
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
@@ -165,13 +495,9 @@ class SkillSwapDatabase:
     def add_user_skill(self, user_id, skill_name, skill_type, proficiency_level="intermediate", description=""):
         """Add skill to User_Skills collection"""
         try:
-            # First, ensure skill exists in Skills collection
-            skill_id = skill_name.lower().replace(' ', '_').replace('-', '_')
-            skill_doc = self.db.collection('skills').document(skill_id).get()
-            
-            if not skill_doc.exists:
-                # Create skill if it doesn't exist
-                self.create_skill(skill_name, f"User-added skill: {skill_name}")
+            skill_id = _slug(skill_name)
+            with self._cache_lock:
+                known = skill_id in self._skill_cache
             
             # Create user-skill relationship
             user_skill_id = f"{user_id}_{skill_id}_{skill_type}"
@@ -192,13 +518,34 @@ class SkillSwapDatabase:
                 'updated_at': firestore.SERVER_TIMESTAMP
             }
             
-            self.db.collection('user_skills').document(user_skill_id).set(user_skill_data)
-            
-            # Update skill counters
-            if skill_type == 'offered':
-                self.db.collection('skills').document(skill_id).update({'users_offering': firestore.Increment(1)})
-            else:
-                self.db.collection('skills').document(skill_id).update({'users_wanting': firestore.Increment(1)})
+            skill_ref = self.db.collection('skills').document(skill_id)
+            user_skill_ref = self.db.collection('user_skills').document(user_skill_id)
+            
+            @firestore.transactional
+            def add_skill(transaction):
+                # All reads come before the writes, as transactions require, and
+                # share one RPC; the skill is only read when not already cached
+                refs = [user_skill_ref] if known else [user_skill_ref, skill_ref]
+                existing = {snap.reference.path for snap in transaction.get_all(refs) if snap.exists}
+                create = not known and skill_ref.path not in existing
+                is_new = user_skill_ref.path not in existing
+                
+                # Ensure skill exists in Skills collection
+                if create:
+                    transaction.set(skill_ref, _skill_data(skill_name, f"User-added skill: {skill_name}"))
+                transaction.set(user_skill_ref, user_skill_data)
+                
+                # Re-adding a skill updates it without counting the user twice
+                if is_new:
+                    transaction.set(*self._skill_counter_update(skill_id, skill_type, 1), merge=True)
+                return create
+            
+            created = add_skill(self.db.transaction())
+            with self._cache_lock:
+                self._skill_cache[skill_id] = True
+                if created:
+                    self._skills_list_cache.clear()
+                    self._search_cache.clear()
             
             return {'success': True, 'message': 'Skill added successfully'}
             
@@ -225,21 +572,89 @@ class SkillSwapDatabase:
     def remove_user_skill(self, user_id, skill_name, skill_type):
         """Remove user skill"""
         try:
-            skill_id = skill_name.lower().replace(' ', '_').replace('-', '_')
+            skill_id = _slug(skill_name)
             user_skill_id = f"{user_id}_{skill_id}_{skill_type}"
             
-            self.db.collection('user_skills').document(user_skill_id).delete()
+            user_skill_ref = self.db.collection('user_skills').document(user_skill_id)
             
-            # Update skill counters
-            if skill_type == 'offered':
-                self.db.collection('skills').document(skill_id).update({'users_offering': firestore.Increment(-1)})
-            else:
-                self.db.collection('skills').document(skill_id).update({'users_wanting': firestore.Increment(-1)})
+            @firestore.transactional
+            def remove_skill(transaction):
+                # Only a skill the user actually had is uncounted
+                if user_skill_ref.get(transaction=transaction).exists:
+                    transaction.delete(user_skill_ref)
+                    transaction.set(*self._skill_counter_update(skill_id, skill_type, -1), merge=True)
+            
+            remove_skill(self.db.transaction())
             
             return {'success': True, 'message': 'Skill removed'}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
+    
+    def _skill_counter_update(self, skill_id, skill_type, delta):
+        """Random counter shard and the merge-set that adds delta to a skill's offering or wanting count"""
+        field = 'users_offering' if skill_type == 'offered' else 'users_wanting'
+        shard = str(random.randrange(SKILL_COUNTER_SHARDS))
+        shard_ref = self.db.collection('skills').document(skill_id).collection('counters').document(shard)
+        return shard_ref, {field: firestore.Increment(delta)}
+    
+    def get_skill_counts(self, skill_id):
+        """Sum a skill's counter shards"""
+        try:
+            counts = {'users_offering': 0, 'users_wanting': 0}
+            for shard in self.db.collection('skills').document(skill_id).collection('counters').stream():
+                shard_data = shard.to_dict()
+                for field in counts:
+                    counts[field] += shard_data.get(field, 0)
+            
+            return {'success': True, 'skill_id': skill_id, 'counts': counts}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def rollup_skill_counts(self):
+        """Copy summed shard counts onto the skill documents read by listings (run on a schedule)"""
+        try:
+            totals = {}
+            for shard in self.db.collection_group('counters').stream():
+                skill_ref = shard.reference.parent.parent
+                counts = totals.setdefault(skill_ref.path, [skill_ref, 0, 0])
+                shard_data = shard.to_dict()
+                counts[1] += shard_data.get('users_offering', 0)
+                counts[2] += shard_data.get('users_wanting', 0)
+            
+            # BulkWriter pipelines the updates in parallel batches and retries
+            # contended documents, instead of committing one batch at a time
+            bulk = self.db.bulk_writer()
+            for skill_ref, offering, wanting in totals.values():
+                bulk.update(skill_ref, {'users_offering': offering, 'users_wanting': wanting})
+            bulk.close()
+            self._forget_skills()
+            return {'success': True, 'updated': len(totals)}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def backfill_skill_counter_shards(self):
+        """Seed shard 0 with the counts of skills counted before sharding"""
+        try:
+            batch = self.db.batch()
+            updated = 0
+            for doc in self.db.collection('skills').stream():
+                counters = doc.reference.collection('counters')
+                if next(iter(counters.limit(1).stream()), None) is not None:
+                    continue
+                skill_data = doc.to_dict()
+                batch.set(counters.document('0'), {
+                    'users_offering': skill_data.get('users_offering', 0),
+                    'users_wanting': skill_data.get('users_wanting', 0)
+                })
+                updated += 1
+                if updated % BATCH_LIMIT == 0:
+                    batch.commit()
+                    batch = self.db.batch()
+            batch.commit()
+            return {'success': True, 'updated': updated}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
 
    
     # BARTER_REQUESTS COLLECTION
@@ -251,6 +666,7 @@ class SkillSwapDatabase:
             request_data = {
                 'sender_id': sender_id,
                 'receiver_id': receiver_id,
+                'participants': [sender_id, receiver_id],
                 'offered_skill_name': offered_skill,
                 'requested_skill_name': requested_skill,
                 'message': message,
@@ -265,61 +681,99 @@ class SkillSwapDatabase:
                 'created_at': firestore.SERVER_TIMESTAMP,
                 'updated_at': firestore.SERVER_TIMESTAMP,
                 'responded_at': None,
-                'expires_at': datetime.now() + timedelta(days=7)  # Auto-expire in 7 days
+                'expires_at': datetime.now(_UTC) + _SEVEN_DAYS  # Auto-expire in 7 days
             }
             
-            doc_ref = self.db.collection('barter_requests').document()
-            doc_ref.set(request_data)
-            
-           
-            self.db.collection('users').document(receiver_id).update({'pending_requests': firestore.Increment(1)})
+            # The request and the receiver's counter commit together in one round trip
+            doc_ref = self.db.collection('barter_requests').document(str(uuid.uuid4()))
+            batch = self.db.batch()
+            batch.set(doc_ref, request_data)
+            batch.update(self.db.collection('users').document(receiver_id), {'pending_requests': firestore.Increment(1)})
+            batch.commit()
+            self._forget_profiles(receiver_id)
             
             return {'success': True, 'request_id': doc_ref.id}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_user_requests(self, user_id, request_type='all'):
-        """Get user's barter requests"""
+    def _user_requests_query(self, user_id, request_type):
+        """Single query for the user's sent, received or all requests"""
+        requests_ref = self.db.collection('barter_requests')
+        if request_type == 'sent':
+            return requests_ref.where('sender_id', '==', user_id)
+        if request_type == 'received':
+            return requests_ref.where('receiver_id', '==', user_id)
+        if request_type == 'all':
+            # Both sides in one RPC via the denormalized participants array
+            return requests_ref.where('participants', 'array_contains', user_id)
+        return None
+    
+    def iter_user_requests(self, user_id, request_type='all', page_size=PAGE_SIZE, start_after_id=None, fields=None):
+        """Stream user's barter requests; a bad cursor raises here, before the first row"""
+        query = self._user_requests_query(user_id, request_type)
+        if query is None:
+            return iter(())
+        
+        # sender_id is always loaded because it decides each request's type
+        query = query.select(sorted(set(fields or REQUEST_LIST_FIELDS) | {'sender_id'}))
+        cursor = self._cursor('barter_requests', start_after_id)
+        return self._typed_requests(self._stream(self._paginate(query, cursor, page_size), 'request_id'), user_id)
+    
+    def _typed_requests(self, rows, user_id):
+        """Tag each streamed request as sent or received from user_id's side"""
+        for request_data in rows:
+            request_data['type'] = 'sent' if request_data['sender_id'] == user_id else 'received'
+            yield request_data
+    
+    def get_user_requests(self, user_id, request_type='all', page_size=PAGE_SIZE, start_after_id=None, fields=None):
+        """Get a page of user's barter requests"""
         try:
-            requests = []
-            
-            if request_type in ['sent', 'all']:
-                sent_query = self.db.collection('barter_requests').where('sender_id', '==', user_id)
-                for doc in sent_query.stream():
-                    request_data = doc.to_dict()
-                    request_data['request_id'] = doc.id
-                    request_data['type'] = 'sent'
-                    requests.append(request_data)
-            
-            if request_type in ['received', 'all']:
-                received_query = self.db.collection('barter_requests').where('receiver_id', '==', user_id)
-                for doc in received_query.stream():
-                    request_data = doc.to_dict()
-                    request_data['request_id'] = doc.id
-                    request_data['type'] = 'received'
-                    requests.append(request_data)
-            
-            return {'success': True, 'requests': requests}
+            user_requests = list(self.iter_user_requests(user_id, request_type, page_size, start_after_id, fields))
+            return {'success': True, 'requests': user_requests,
+                    'next_cursor': self._next_cursor(user_requests, 'request_id', page_size)}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def update_request_status(self, request_id, status, response_message=""):
-        """Update barter request status"""
+    def update_request_status(self, request_id, status, response_message="", user_id=None):
+        """Answer a pending barter request; user_id, when given, must be the side allowed to"""
         try:
+            if status not in REQUEST_RESPONDERS:
+                return {'success': False, 'error': 'Invalid status'}
+            
             updates = {
                 'status': status,
                 'updated_at': firestore.SERVER_TIMESTAMP,
                 'responded_at': firestore.SERVER_TIMESTAMP,
                 'response_message': response_message
             }
-            
-            self.db.collection('barter_requests').document(request_id).update(updates)
-            
-           
-            if status == 'accepted':
-                self.create_transaction_from_request(request_id)
+            request_ref = self.db.collection('barter_requests').document(request_id)
+            
+            @firestore.transactional
+            def respond(transaction):
+                # The status is read inside the transaction, so a repeated or
+                # concurrent accept sees the first one and a swap counts once
+                request_doc = request_ref.get(transaction=transaction)
+                if not request_doc.exists:
+                    return 'Request not found', ()
+                request_data = request_doc.to_dict()
+                if request_data.get('status') != 'pending':
+                    return 'Request is no longer pending', ()
+                if user_id is not None and request_data[REQUEST_RESPONDERS[status]] != user_id:
+                    return 'Not allowed to update this request', ()
+                
+                participants = ()
+                if status == 'accepted':
+                    # The status change and the new transaction commit together
+                    updates['transaction_id'], participants = self._add_transaction(transaction, request_id, request_data)
+                transaction.update(request_ref, updates)
+                return None, participants
+            
+            error, participants = respond(self.db.transaction())
+            if error:
+                return {'success': False, 'error': error}
+            self._forget_profiles(*participants)
             
             return {'success': True, 'message': 'Request status updated'}
             
@@ -337,67 +791,98 @@ class SkillSwapDatabase:
             request_doc = self.db.collection('barter_requests').document(request_id).get()
             if not request_doc.exists:
                 return {'success': False, 'error': 'Request not found'}
-            
             request_data = request_doc.to_dict()
+            if request_data.get('transaction_id'):
+                return {'success': False, 'error': 'Request already has a transaction'}
             
-            transaction_data = {
-                'barter_request_id': request_id,
-                'user1_id': request_data['sender_id'],
-                'user2_id': request_data['receiver_id'],
-                'user1_skill': request_data['offered_skill_name'],
-                'user2_skill': request_data['requested_skill_name'],
-                'status': 'in_progress',  # in_progress, completed, cancelled, disputed
-                'start_date': firestore.SERVER_TIMESTAMP,
-                'expected_end_date': datetime.now() + timedelta(weeks=2),
-                'actual_end_date': None,
-                'user1_confirmed': False,
-                'user2_confirmed': False,
-                'completion_percentage': 0,
-                'sessions': [],
-                'is_disputed': False,
-                'dispute_reason': '',
-                'admin_notes': '',
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'updated_at': firestore.SERVER_TIMESTAMP
-            }
-            
-            doc_ref = self.db.collection('transactions').document()
-            doc_ref.set(transaction_data)
+            batch = self.db.batch()
+            transaction_id, participants = self._add_transaction(batch, request_id, request_data)
             
             # Update request with transaction ID
-            self.db.collection('barter_requests').document(request_id).update({'transaction_id': doc_ref.id})
+            batch.update(request_doc.reference, {'transaction_id': transaction_id})
+            batch.commit()
+            self._forget_profiles(*participants)
             
-            return {'success': True, 'transaction_id': doc_ref.id}
+            return {'success': True, 'transaction_id': transaction_id}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_user_transactions(self, user_id):
-        """Get user's transactions"""
+    def _add_transaction(self, batch, request_id, request_data):
+        """Queue a new transaction for a request and both users' swap counts on a batch or transaction"""
+        transaction_data = {
+            'barter_request_id': request_id,
+            'user1_id': request_data['sender_id'],
+            'user2_id': request_data['receiver_id'],
+            'participants': [request_data['sender_id'], request_data['receiver_id']],
+            'user1_skill': request_data['offered_skill_name'],
+            'user2_skill': request_data['requested_skill_name'],
+            'status': 'in_progress',  # in_progress, completed, cancelled, disputed
+            'start_date': firestore.SERVER_TIMESTAMP,
+            'expected_end_date': datetime.now(_UTC) + _TWO_WEEKS,
+            'actual_end_date': None,
+            'user1_confirmed': False,
+            'user2_confirmed': False,
+            'completion_percentage': 0,
+            'sessions': [],
+            'is_disputed': False,
+            'dispute_reason': '',
+            'admin_notes': '',
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }
+        
+        transaction_id = str(uuid.uuid4())
+        batch.set(self.db.collection('transactions').document(transaction_id), transaction_data)
+        
+        # Count the swap for both participants
+        participants = transaction_data['participants']
+        for user_id in participants:
+            batch.update(self.db.collection('users').document(user_id), {'total_swaps': firestore.Increment(1)})
+        
+        return transaction_id, participants
+    
+    def get_user_transactions(self, user_id, page_size=PAGE_SIZE, start_after_id=None):
+        """Get a page of user's transactions"""
         try:
             transactions = []
             
-            # Transactions where user is user1
-            query1 = self.db.collection('transactions').where('user1_id', '==', user_id)
-            for doc in query1.stream():
-                transaction_data = doc.to_dict()
-                transaction_data['transaction_id'] = doc.id
-                transaction_data['user_role'] = 'user1'
-                transactions.append(transaction_data)
-            
-            # Transactions where user is user2
-            query2 = self.db.collection('transactions').where('user2_id', '==', user_id)
-            for doc in query2.stream():
+            # Transactions where user is either side, in one RPC
+            query = self.db.collection('transactions').where('participants', 'array_contains', user_id)
+            cursor = self._cursor('transactions', start_after_id)
+            for doc in self._paginate(query, cursor, page_size).stream():
                 transaction_data = doc.to_dict()
                 transaction_data['transaction_id'] = doc.id
-                transaction_data['user_role'] = 'user2'
+                transaction_data['user_role'] = 'user1' if transaction_data['user1_id'] == user_id else 'user2'
                 transactions.append(transaction_data)
             
-            return {'success': True, 'transactions': transactions}
+            return {'success': True, 'transactions': transactions,
+                    'next_cursor': self._next_cursor(transactions, 'transaction_id', page_size)}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
+    def backfill_participants(self):
+        """Add the participants array to requests and transactions written before it existed"""
+        try:
+            sides = {'barter_requests': ('sender_id', 'receiver_id'), 'transactions': ('user1_id', 'user2_id')}
+            batch = self.db.batch()
+            updated = 0
+            for collection, (first, second) in sides.items():
+                for doc in self.db.collection(collection).stream():
+                    data = doc.to_dict()
+                    if 'participants' in data:
+                        continue
+                    batch.update(doc.reference, {'participants': [data[first], data[second]]})
+                    updated += 1
+                    if updated % BATCH_LIMIT == 0:
+                        batch.commit()
+                        batch = self.db.batch()
+            batch.commit()
+            return {'success': True, 'updated': updated}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
     
     # REVIEWS COLLECTION
    
@@ -427,39 +912,58 @@ class SkillSwapDatabase:
                 'updated_at': firestore.SERVER_TIMESTAMP
             }
             
-            doc_ref = self.db.collection('reviews').document()
-            doc_ref.set(review_data)
+            doc_ref = self.db.collection('reviews').document(str(uuid.uuid4()))
+            user_ref = self.db.collection('users').document(reviewee_id)
+            
+            @firestore.transactional
+            def write_review(transaction):
+                snapshot = user_ref.get(transaction=transaction)
+                transaction.set(doc_ref, review_data)
+                if not snapshot.exists:
+                    return
+                
+                # Fold the new rating into the running totals instead of rescanning reviews
+                user = snapshot.to_dict()
+                count = user.get('rating_count', 0)
+                total = user.get('rating_sum', user.get('rating_avg', 0.0) * count)
+                transaction.update(user_ref, {
+                    'rating_avg': round((total + rating) / (count + 1), 1),
+                    'rating_count': count + 1,
+                    'rating_sum': total + rating
+                })
             
-            # Update reviewee's rating
-            self.update_user_rating(reviewee_id)
+            write_review(self.db.transaction())
+            self._forget_profiles(reviewee_id)
             
             return {'success': True, 'review_id': doc_ref.id}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def update_user_rating(self, user_id):
-        """Update user's average rating"""
+    def rebuild_user_rating(self, user_id):
+        """Recompute user's rating totals from all approved reviews (admin repair)"""
         try:
             reviews_query = self.db.collection('reviews').where('reviewee_id', '==', user_id).where('is_approved', '==', True)
-            reviews = list(reviews_query.stream())
             
-            if reviews:
-                total_rating = sum([r.to_dict()['rating'] for r in reviews])
-                avg_rating = round(total_rating / len(reviews), 1)
-                
-                self.db.collection('users').document(user_id).update({
-                    'rating_avg': avg_rating,
-                    'rating_count': len(reviews)
-                })
+            # Firestore computes count and sum server-side, so no review documents are read
+            aggregate = reviews_query.count(alias='count').sum('rating', alias='total')
+            totals = {result.alias: result.value for result in aggregate.get()[0]}
+            count, total_rating = totals['count'], totals['total'] or 0
+            
+            self.db.collection('users').document(user_id).update({
+                'rating_avg': round(total_rating / count, 1) if count else 0.0,
+                'rating_count': count,
+                'rating_sum': total_rating
+            })
+            self._forget_profiles(user_id)
             
             return {'success': True}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_user_reviews(self, user_id, as_reviewee=True):
-        """Get reviews for a user"""
+    def get_user_reviews(self, user_id, as_reviewee=True, page_size=PAGE_SIZE, start_after_id=None):
+        """Get a page of reviews for a user"""
         try:
             if as_reviewee:
                 query = self.db.collection('reviews').where('reviewee_id', '==', user_id).where('is_public', '==', True)
@@ -467,12 +971,13 @@ class SkillSwapDatabase:
                 query = self.db.collection('reviews').where('reviewer_id', '==', user_id)
             
             reviews = []
-            for doc in query.stream():
+            cursor = self._cursor('reviews', start_after_id)
+            for doc in self._paginate(query, cursor, page_size).stream():
                 review_data = doc.to_dict()
                 review_data['review_id'] = doc.id
                 reviews.append(review_data)
             
-            return {'success': True, 'reviews': reviews}
+            return {'success': True, 'reviews': reviews, 'next_cursor': self._next_cursor(reviews, 'review_id', page_size)}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
@@ -484,29 +989,8 @@ class SkillSwapDatabase:
     def create_system_message(self, admin_id, title, message, message_type="announcement"):
         """Create platform-wide message"""
         try:
-            message_data = {
-                'admin_id': admin_id,
-                'admin_name': 'Admin',  # Get from user profile
-                'title': title,
-                'message': message,
-                'type': message_type,  # announcement, maintenance, feature_update, warning
-                'priority': 'normal',  # low, normal, high, urgent
-                'target_audience': 'all',  # all, users, admins, specific
-                'target_user_ids': [],
-                'target_roles': ['user'],
-                'is_active': True,
-                'is_dismissible': True,
-                'show_until': datetime.now() + timedelta(days=7),
-                'display_location': 'banner',  # banner, modal, notification
-                'view_count': 0,
-                'dismissal_count': 0,
-                'click_count': 0,
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'updated_at': firestore.SERVER_TIMESTAMP,
-                'published_at': firestore.SERVER_TIMESTAMP
-            }
-            
-            doc_ref = self.db.collection('system_messages').document()
+            message_data = _system_message_data(admin_id, title, message, message_type)
+            doc_ref = self.db.collection('system_messages').document(str(uuid.uuid4()))
             doc_ref.set(message_data)
             
             return {'success': True, 'message_id': doc_ref.id}
@@ -517,16 +1001,17 @@ class SkillSwapDatabase:
     def get_active_messages(self):
         """Get active system messages"""
         try:
-            query = self.db.collection('system_messages').where('is_active', '==', True)
+            # Expired messages are filtered out by Firestore, not after reading them
+            query = (self.db.collection('system_messages')
+                     .where('is_active', '==', True)
+                     .where('show_until', '>', datetime.now(_UTC))
+                     .order_by('show_until'))
             messages = []
             
             for doc in query.stream():
                 message_data = doc.to_dict()
                 message_data['message_id'] = doc.id
-                
-                # Check if message is still valid
-                if message_data.get('show_until') and message_data['show_until'] > datetime.now():
-                    messages.append(message_data)
+                messages.append(message_data)
             
             return {'success': True, 'messages': messages}
             
@@ -540,36 +1025,27 @@ class SkillSwapDatabase:
     def setup_sample_data(self):
         """Create sample data for testing"""
         try:
-            # Sample skills
-            sample_skills = [
-                {'name': 'JavaScript Programming', 'description': 'Modern JavaScript development', 'category': 'Programming'},
-                {'name': 'Python Programming', 'description': 'Python for web development and data science', 'category': 'Programming'},
-                {'name': 'Graphic Design', 'description': 'Visual design and branding', 'category': 'Design'},
-                {'name': 'Photography', 'description': 'Digital photography and editing', 'category': 'Creative'},
-                {'name': 'Spanish Language', 'description': 'Conversational and business Spanish', 'category': 'Languages'},
-                {'name': 'Guitar Playing', 'description': 'Acoustic and electric guitar', 'category': 'Music'},
-                {'name': 'Cooking', 'description': 'International cuisine and baking', 'category': 'Lifestyle'},
-                {'name': 'Digital Marketing', 'description': 'Social media and online marketing', 'category': 'Business'},
-                {'name': 'Data Science', 'description': 'Data analysis and machine learning', 'category': 'Programming'},
-                {'name': 'UI/UX Design', 'description': 'User interface and experience design', 'category': 'Design'}
-            ]
-            
-            for skill in sample_skills:
-                self.create_skill(skill['name'], skill['description'], skill['category'])
-            
-            print(" Sample skills created successfully")
-            
-            # Sample system message
-            self.create_system_message(
+            # One commit per BATCH_LIMIT writes instead of one round trip each;
+            # the welcome message rides along in the last batch
+            skills = self.db.collection('skills')
+            batch = self.db.batch()
+            for count, skill_data in enumerate(_SAMPLE_SKILL_PAYLOADS, 1):
+                batch.set(skills.document(skill_data['skill_id']), skill_data)
+                if count % BATCH_LIMIT == 0:
+                    batch.commit()
+                    batch = self.db.batch()
+            batch.set(self.db.collection('system_messages').document(str(uuid.uuid4())), _system_message_data(
                 'admin',
                 'Welcome to Skill Swap Platform!',
                 'Start connecting with other learners and share your skills today.',
                 'announcement'
-            )
+            ))
+            batch.commit()
+            self._forget_skills()
             
-            print("Sample system message created")
+            log.info("Sample skills and system message created")
             return {'success': True, 'message': 'Sample data created successfully'}
             
         except Exception as e:
-            print(f" Error creating sample data: {e}")
+            log.error("Error creating sample data: %s", e)
             return {'success': False, 'error': str(e)}
\ No newline at end of file
@@ -1,56 +1,171 @@
+import logging
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from types import MappingProxyType
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials
+import orjson
 import requests
 from dotenv import load_dotenv
 from complete_database import SkillSwapDatabase
+import token_pool
 
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 # =============================================================================
 # FIREBASE CONFIG FROM .ENV FILE
 # =============================================================================
 
+# Firebase web config keys and the environment variables they come from
+_CONFIG_ENV = (
+    ("apiKey", "FIREBASE_API_KEY"),
+    ("authDomain", "FIREBASE_AUTH_DOMAIN"),
+    ("projectId", "FIREBASE_PROJECT_ID"),
+    ("storageBucket", "FIREBASE_STORAGE_BUCKET"),
+    ("messagingSenderId", "FIREBASE_MESSAGING_SENDER_ID"),
+    ("appId", "FIREBASE_APP_ID"),
+)
+
+@lru_cache(maxsize=1)
 def get_firebase_config():
-    """Get Firebase configuration from environment variables"""
-    config = {
-        "apiKey": os.getenv("FIREBASE_API_KEY"),
-        "authDomain": os.getenv("FIREBASE_AUTH_DOMAIN"),
-        "projectId": os.getenv("FIREBASE_PROJECT_ID"),
-        "storageBucket": os.getenv("FIREBASE_STORAGE_BUCKET"),
-        "messagingSenderId": os.getenv("FIREBASE_MESSAGING_SENDER_ID"),
-        "appId": os.getenv("FIREBASE_APP_ID")
-    }
+    """Get Firebase configuration from environment variables, read and validated once per process"""
+    values = tuple(os.getenv(env) for _, env in _CONFIG_ENV)
     
     # Check if all required environment variables are set
-    missing_vars = [key for key, value in config.items() if not value]
-    
-    if missing_vars:
-        print(f"❌ Missing environment variables: {missing_vars}")
-        print("📝 Please check your .env file and make sure all Firebase values are set")
-        print("🔧 Your .env file should contain:")
-        print("   FIREBASE_API_KEY=your_api_key")
-        print("   FIREBASE_AUTH_DOMAIN=your_project.firebaseapp.com")
-        print("   FIREBASE_PROJECT_ID=your_project_id")
-        print("   FIREBASE_STORAGE_BUCKET=your_project.appspot.com")
-        print("   FIREBASE_MESSAGING_SENDER_ID=your_sender_id")
-        print("   FIREBASE_APP_ID=your_app_id")
+    if not all(values):
+        missing_vars = [key for (key, _), value in zip(_CONFIG_ENV, values) if not value]
+        log.error("Missing environment variables: %s. Your .env file should contain:\n"
+                  "   FIREBASE_API_KEY=your_api_key\n"
+                  "   FIREBASE_AUTH_DOMAIN=your_project.firebaseapp.com\n"
+                  "   FIREBASE_PROJECT_ID=your_project_id\n"
+                  "   FIREBASE_STORAGE_BUCKET=your_project.appspot.com\n"
+                  "   FIREBASE_MESSAGING_SENDER_ID=your_sender_id\n"
+                  "   FIREBASE_APP_ID=your_app_id", missing_vars)
         raise ValueError(f"Missing required environment variables: {missing_vars}")
     
-    return config
+    # Read-only, so the shared config can't be changed from under other threads
+    return MappingProxyType(dict(zip((key for key, _ in _CONFIG_ENV), values)))
 
-# Get Firebase configuration
+# Get Firebase configuration; this, the URLs below and FirebaseAuth.api_key
+# keep these values for the life of the process, so changes need a restart
 FIREBASE_CONFIG = get_firebase_config()
 
+# Identity Toolkit REST endpoints, formatted with the API key once
+IDENTITY_TOOLKIT_URL = "https://identitytoolkit.googleapis.com/v1/accounts"
+SIGN_UP_URL = f"{IDENTITY_TOOLKIT_URL}:signUp?key={FIREBASE_CONFIG['apiKey']}"
+SIGN_IN_URL = f"{IDENTITY_TOOLKIT_URL}:signInWithPassword?key={FIREBASE_CONFIG['apiKey']}"
+
+# (connect, read) timeouts in seconds for Identity Toolkit calls
+AUTH_TIMEOUT = (3.05, 5)
+# After this many consecutive failed calls, fail fast for AUTH_BREAKER_RESET seconds
+AUTH_BREAKER_FAILURES = 10
+AUTH_BREAKER_RESET = 30
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Best-effort work that should not hold up the response, e.g. last_login
+_background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="firebase-bg")
+
+# First pages of public users are served from memory while younger than
+# PUBLIC_USERS_FRESH seconds, and served while refreshed in the background
+# until PUBLIC_USERS_STALE seconds
+PUBLIC_USERS_FRESH = 5
+PUBLIC_USERS_STALE = 60
+
+@dataclass(slots=True, frozen=True)
+class RegisterResult:
+    """Body of a successful registration; orjson serializes it without an intermediate dict"""
+    user: dict
+    success: bool = True
+    message: str = 'User registered successfully'
+
+@dataclass(slots=True, frozen=True)
+class LoginResult:
+    """Body of a successful login; frozen, since coalesced logins share one instance"""
+    user: dict
+    profile: dict
+    success: bool = True
+    message: str = 'Login successful'
+
+@dataclass(slots=True)
+class ApiResult:
+    """Outcome of a FirebaseAuth call: the JSON body and the HTTP status to send it with"""
+    ok: bool
+    data: dict | RegisterResult | LoginResult
+    status: int = 200
+    
+    @classmethod
+    def from_dict(cls, result):
+        """Wrap a {'success': ..., ...} dict from the database layer"""
+        ok = bool(result.get('success'))
+        return cls(ok, result, 200 if ok else 400)
+    
+    @classmethod
+    def failure(cls, error, status=400):
+        """Build a failed result carrying an error message"""
+        return cls(False, {'success': False, 'error': error}, status)
+
+class AuthUnavailable(Exception):
+    """Identity Toolkit is failing and calls are being refused until it recovers"""
+
+class _CircuitBreaker:
+    """Refuse calls after fail_max consecutive failures; after reset_timeout one probe is let through"""
+    
+    def __init__(self, fail_max, reset_timeout):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+    
+    def allow(self):
+        """Whether a call may go out now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Half-open: this caller probes, everyone else waits another period
+                self._opened_at = time.monotonic()
+                return True
+            return False
+    
+    def record(self, ok):
+        """Count the outcome of a call that was allowed through"""
+        with self._lock:
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._failures >= self.fail_max:
+                    self._opened_at = time.monotonic()
+
+_identity_breaker = _CircuitBreaker(AUTH_BREAKER_FAILURES, AUTH_BREAKER_RESET)
+
 class FirebaseAuth:
     def __init__(self):
-        self.db_manager = SkillSwapDatabase(FIREBASE_CONFIG)
         self.initialized = False
         self.api_key = FIREBASE_CONFIG["apiKey"]
-        print(f"🔧 Firebase API Key loaded: {self.api_key[:10]}..." if self.api_key else "❌ No API Key")
+        self._public_users_lock = threading.Lock()
+        self._public_users_cache = {}
+        self._public_users_refreshing = set()
+        self._public_users_generation = 0
+        self._inflight_lock = threading.Lock()
+        self._inflight = {}
+        log.debug("Firebase API Key loaded: %s...", self.api_key[:10])
+    
+    @cached_property
+    def db_manager(self):
+        """Database layer, built on first use rather than when FirebaseAuth is created"""
+        return SkillSwapDatabase(FIREBASE_CONFIG)
     
-    def initialize(self):
+    def initialize(self, db_client=None):
         """Initialize Firebase and Database"""
         try:
             # Initialize Firebase Admin
@@ -61,138 +176,244 @@ class FirebaseAuth:
                 if os.path.exists(creds_path):
                     cred = credentials.Certificate(creds_path)
                     firebase_admin.initialize_app(cred)
-                    print(f" Firebase Admin initialized with credentials from: {creds_path}")
+                    log.info("Firebase Admin initialized with credentials from: %s", creds_path)
                 else:
-                    print(f"Firebase credentials file not found: {creds_path}")
+                    log.error("Firebase credentials file not found: %s", creds_path)
                     return False
             
             # Initialize database manager
-            if self.db_manager.initialize():
+            if self.db_manager.initialize(db_client):
                 self.initialized = True
-                print("Firebase and Database initialized successfully")
+                log.info("Firebase and Database initialized")
                 return True
             else:
-                print(" Database manager initialization failed")
+                log.error("Database manager initialization failed")
                 return False
             
         except Exception as e:
-            print(f"Firebase initialization failed: {e}")
+            log.error("Firebase initialization failed: %s", e)
             return False
     
+    def preload_token_certs(self):
+        """Fetch the ID-token signing certs now for this process's inline verifier, through the shared disk cache"""
+        try:
+            from firebase_admin._token_gen import ID_TOKEN_CERT_URI
+            token_pool.install_cert_cache()(ID_TOKEN_CERT_URI)
+            return True
+        except Exception as e:
+            log.warning("Token cert preload skipped: %s", e)
+            return False
+    
+    def _identity_post(self, url, data):
+        """POST to Identity Toolkit, serializing both ways with orjson; returns (status, body)"""
+        if not _identity_breaker.allow():
+            raise AuthUnavailable()
+        try:
+            response = self.db_manager.http.post(url, data=orjson.dumps(data), headers=JSON_HEADERS, timeout=AUTH_TIMEOUT)
+        except requests.RequestException:
+            _identity_breaker.record(False)
+            raise
+        # 4xx (bad password, existing email) is a healthy answer; only 5xx counts against the breaker
+        _identity_breaker.record(response.status_code < 500)
+        return response.status_code, orjson.loads(response.content)
+    
+    def _single_flight(self, key, fn, *args):
+        """Run fn once for concurrent callers with the same key and hand them all its result"""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+        
+        try:
+            result = fn(*args)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+    
     def register_user(self, email, password, name, location=""):
-        """Register new user with complete profile"""
+        """Register new user with complete profile; identical concurrent attempts share one call"""
+        # The password is part of the key so only truly identical attempts are merged
+        return self._single_flight(("register", email, password, name, location),
+                                   self._register_user, email, password, name, location)
+    
+    def _register_user(self, email, password, name, location):
         try:
             # Create authentication user
-            url = f"https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={self.api_key}"
-            
             data = {
                 "email": email,
                 "password": password,
                 "returnSecureToken": True
             }
             
-            response = requests.post(url, json=data)
-            result = response.json()
+            status, result = self._identity_post(SIGN_UP_URL, data)
             
-            if response.status_code == 200:
+            if status == 200:
                 # Create complete user profile using database manager
                 profile_result = self.db_manager.create_user_profile(
                     result['localId'], email, name, location
                 )
                 
                 if profile_result['success']:
-                    return {
-                        'success': True,
-                        'user': result,
-                        'message': 'User registered successfully'
-                    }
+                    return ApiResult(True, RegisterResult(result))
                 else:
-                    return {'success': False, 'error': 'Failed to create user profile'}
+                    return ApiResult.failure('Failed to create user profile')
             else:
                 error_msg = result.get('error', {}).get('message', 'Registration failed')
-                return {'success': False, 'error': error_msg}
+                return ApiResult.failure(error_msg)
                     
+        except (AuthUnavailable, requests.RequestException):
+            return ApiResult.failure('auth_unavailable', 503)
         except Exception as e:
-            return {'success': False, 'error': str(e)}
+            return ApiResult.failure(str(e))
     
     def login_user(self, email, password):
-        """Login user and get complete profile"""
+        """Login user and get complete profile; identical concurrent attempts share one call"""
+        # Keyed on the password too, so a wrong password never gets another attempt's session
+        return self._single_flight(("login", email, password), self._login_user, email, password)
+    
+    def _login_user(self, email, password):
         try:
-            url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={self.api_key}"
-            
             data = {
                 "email": email,
                 "password": password,
                 "returnSecureToken": True
             }
             
-            response = requests.post(url, json=data)
-            result = response.json()
+            status, result = self._identity_post(SIGN_IN_URL, data)
             
-            if response.status_code == 200:
-                # Get complete user profile
+            if status == 200:
+                # Stamp last_login in the background while the profile is read here,
+                # so the two Firestore round trips overlap; an update to a missing
+                # profile just fails and the login is refused below anyway
+                _background.submit(self.db_manager.record_login, result['localId'])
                 profile_result = self.db_manager.get_user_profile(result['localId'])
                 
                 if profile_result['success']:
-                    # Update last login
-                    self.db_manager.update_user_profile(result['localId'], {
-                        'last_login': firestore.SERVER_TIMESTAMP
-                    })
-                    
-                    return {
-                        'success': True,
-                        'user': result,
-                        'profile': profile_result['profile'],
-                        'message': 'Login successful'
-                    }
+                    return ApiResult(True, LoginResult(result, profile_result['profile']))
                 else:
-                    return {'success': False, 'error': 'Profile not found'}
+                    return ApiResult.failure('Profile not found')
             else:
                 error_msg = result.get('error', {}).get('message', 'Login failed')
-                return {'success': False, 'error': error_msg}
+                return ApiResult.failure(error_msg)
                     
+        except (AuthUnavailable, requests.RequestException):
+            return ApiResult.failure('auth_unavailable', 503)
         except Exception as e:
-            return {'success': False, 'error': str(e)}
+            return ApiResult.failure(str(e))
     
     # =========================================================================
     # USER PROFILE METHODS
     # =========================================================================
     
-    def get_user_profile(self, user_id):
-        """Get user profile"""
-        return self.db_manager.get_user_profile(user_id)
+    def get_user_profile(self, user_id, fields=None):
+        """Get user profile (served from the database layer's TTL cache when warm)"""
+        return ApiResult.from_dict(self.db_manager.get_user_profile(user_id, fields))
     
     def update_user_profile(self, user_id, updates):
         """Update user profile"""
-        return self.db_manager.update_user_profile(user_id, updates)
+        result = ApiResult.from_dict(self.db_manager.update_user_profile(user_id, updates))
+        if result.ok:
+            # Names, photos and visibility all show up in the public list
+            self.invalidate_public_users()
+        return result
+    
+    def get_public_users(self, limit=50, start_after_id=None, fields=None):
+        """Get public users for browsing; first pages are stale-while-revalidate cached"""
+        if start_after_id is not None or fields is not None:
+            return ApiResult.from_dict(self.db_manager.get_public_users(limit, start_after_id, fields))
+        
+        with self._public_users_lock:
+            cached = self._public_users_cache.get(limit)
+        if cached is not None:
+            age = time.monotonic() - cached[0]
+            if age < PUBLIC_USERS_FRESH:
+                return cached[1]
+            if age < PUBLIC_USERS_STALE:
+                self._revalidate_public_users(limit)
+                return cached[1]
+        
+        return self._load_public_users(limit)
+    
+    def _load_public_users(self, limit):
+        """Read a first page of public users and cache it if nothing invalidated it meanwhile"""
+        generation = self._public_users_generation
+        result = ApiResult.from_dict(self.db_manager.get_public_users(limit))
+        if result.ok:
+            with self._public_users_lock:
+                if generation == self._public_users_generation:
+                    self._public_users_cache[limit] = (time.monotonic(), result)
+        return result
+    
+    def _revalidate_public_users(self, limit):
+        """Refresh a stale page in the background, once at a time per limit"""
+        with self._public_users_lock:
+            if limit in self._public_users_refreshing:
+                return
+            self._public_users_refreshing.add(limit)
+        
+        def refresh():
+            try:
+                self._load_public_users(limit)
+            finally:
+                with self._public_users_lock:
+                    self._public_users_refreshing.discard(limit)
+        
+        _background.submit(refresh)
+    
+    def invalidate_public_users(self):
+        """Drop cached public user pages so the next browse reads Firestore"""
+        with self._public_users_lock:
+            self._public_users_generation += 1
+            self._public_users_cache.clear()
     
-    def get_public_users(self, limit=50):
-        """Get public users for browsing"""
-        return self.db_manager.get_public_users(limit)
+    def clear_caches(self):
+        """Drop this process's cached public user pages and database-layer caches"""
+        self.invalidate_public_users()
+        self.db_manager.clear_caches()
+    
+    def iter_public_users(self, limit=50, start_after_id=None, fields=None):
+        """Stream public users for browsing"""
+        return self.db_manager.iter_public_users(limit, start_after_id, fields)
     
     # =========================================================================
     # SKILLS METHODS
     # =========================================================================
     
-    def get_all_skills(self):
+    def get_all_skills(self, fields=None):
         """Get all available skills"""
-        return self.db_manager.get_all_skills()
+        return ApiResult.from_dict(self.db_manager.get_all_skills(fields))
+    
+    def iter_all_skills(self, fields=None):
+        """Stream all available skills"""
+        return self.db_manager.iter_all_skills(fields)
     
-    def search_skills(self, query, category=None):
+    def search_skills(self, query, category=None, fields=None, **page):
         """Search skills"""
-        return self.db_manager.search_skills(query, category)
+        return ApiResult.from_dict(self.db_manager.search_skills(query, category, fields, **page))
+    
+    def get_skill_counts(self, skill_id):
+        """Get how many users offer and want a skill"""
+        return ApiResult.from_dict(self.db_manager.get_skill_counts(skill_id))
     
     def add_user_skill(self, user_id, skill_name, skill_type, proficiency="intermediate", description=""):
         """Add skill to user"""
-        return self.db_manager.add_user_skill(user_id, skill_name, skill_type, proficiency, description)
+        return ApiResult.from_dict(self.db_manager.add_user_skill(user_id, skill_name, skill_type, proficiency, description))
     
     def get_user_skills(self, user_id, skill_type=None):
         """Get user's skills"""
-        return self.db_manager.get_user_skills(user_id, skill_type)
+        return ApiResult.from_dict(self.db_manager.get_user_skills(user_id, skill_type))
     
     def remove_user_skill(self, user_id, skill_name, skill_type):
         """Remove user skill"""
-        return self.db_manager.remove_user_skill(user_id, skill_name, skill_type)
+        return ApiResult.from_dict(self.db_manager.remove_user_skill(user_id, skill_name, skill_type))
     
     # =========================================================================
     # BARTER REQUESTS METHODS
@@ -200,23 +421,27 @@ class FirebaseAuth:
     
     def create_barter_request(self, sender_id, receiver_id, offered_skill, requested_skill, message=""):
         """Create skill swap request"""
-        return self.db_manager.create_barter_request(sender_id, receiver_id, offered_skill, requested_skill, message)
+        return ApiResult.from_dict(self.db_manager.create_barter_request(sender_id, receiver_id, offered_skill, requested_skill, message))
     
-    def get_user_requests(self, user_id, request_type='all'):
+    def get_user_requests(self, user_id, request_type='all', **page):
         """Get user's barter requests"""
-        return self.db_manager.get_user_requests(user_id, request_type)
+        return ApiResult.from_dict(self.db_manager.get_user_requests(user_id, request_type, **page))
     
-    def update_request_status(self, request_id, status, response_message=""):
+    def iter_user_requests(self, user_id, request_type='all', **page):
+        """Stream user's barter requests"""
+        return self.db_manager.iter_user_requests(user_id, request_type, **page)
+    
+    def update_request_status(self, request_id, status, response_message="", user_id=None):
         """Update request status"""
-        return self.db_manager.update_request_status(request_id, status, response_message)
+        return ApiResult.from_dict(self.db_manager.update_request_status(request_id, status, response_message, user_id))
     
     # =========================================================================
     # TRANSACTIONS METHODS
     # =========================================================================
     
-    def get_user_transactions(self, user_id):
+    def get_user_transactions(self, user_id, **page):
         """Get user's transactions"""
-        return self.db_manager.get_user_transactions(user_id)
+        return ApiResult.from_dict(self.db_manager.get_user_transactions(user_id, **page))
     
     # =========================================================================
     # REVIEWS METHODS
@@ -224,11 +449,11 @@ class FirebaseAuth:
     
     def create_review(self, reviewer_id, reviewee_id, transaction_id, rating, comment, title=""):
         """Create review after transaction"""
-        return self.db_manager.create_review(reviewer_id, reviewee_id, transaction_id, rating, comment, title)
+        return ApiResult.from_dict(self.db_manager.create_review(reviewer_id, reviewee_id, transaction_id, rating, comment, title))
     
-    def get_user_reviews(self, user_id, as_reviewee=True):
+    def get_user_reviews(self, user_id, as_reviewee=True, **page):
         """Get user reviews"""
-        return self.db_manager.get_user_reviews(user_id, as_reviewee)
+        return ApiResult.from_dict(self.db_manager.get_user_reviews(user_id, as_reviewee, **page))
     
     # =========================================================================
     # SYSTEM MESSAGES METHODS
@@ -236,11 +461,11 @@ class FirebaseAuth:
     
     def get_active_messages(self):
         """Get active system messages"""
-        return self.db_manager.get_active_messages()
+        return ApiResult.from_dict(self.db_manager.get_active_messages())
     
     def create_system_message(self, admin_id, title, message, message_type="announcement"):
         """Create system message (admin only)"""
-        return self.db_manager.create_system_message(admin_id, title, message, message_type)
+        return ApiResult.from_dict(self.db_manager.create_system_message(admin_id, title, message, message_type))
     
     # =========================================================================
     # SETUP METHODS
@@ -248,7 +473,15 @@ class FirebaseAuth:
     
     def setup_sample_data(self):
         """Setup sample data for testing"""
-        return self.db_manager.setup_sample_data()
+        return ApiResult.from_dict(self.db_manager.setup_sample_data())
+
+@lru_cache(maxsize=1)
+def get_auth():
+    """The process-wide FirebaseAuth, created on first call"""
+    return FirebaseAuth()
 
-# Global instance
-firebase_auth = FirebaseAuth()
+def __getattr__(name):
+    """Create the global firebase_auth on first access rather than at import (PEP 562)"""
+    if name == "firebase_auth":
+        return get_auth()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
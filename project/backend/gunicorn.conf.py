@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for the SkillSwap API
+Run from this directory with: gunicorn
+"""
+
+import os
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+
+if worker_class == "gevent":
+    # Patch sockets before anything imports ssl/requests/grpc, so blocking
+    # Firestore and Identity Toolkit calls yield to other requests
+    from gevent import monkey
+    monkey.patch_all()
+    
+    from grpc.experimental import gevent as grpc_gevent
+    grpc_gevent.init_gevent()
+
+import multiprocessing
+
+wsgi_app = "app:create_app()"
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}"
+
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_connections = 1000
+# Only used by gthread workers, where each thread serves one request at a time
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# Hold idle client connections open so keep-alive clients skip reconnecting
+keepalive = 30
+
+# Import the app (and run Firebase init) once in the master before forking
+preload_app = True
+
+def post_worker_init(worker):
+    """Start this worker's token verifier processes before it takes requests"""
+    # Pools are per process, so the preloaded master's can't be shared
+    import token_pool
+    token_pool.warm()
@@ -0,0 +1,36 @@
+import decimal
+from datetime import date
+
+import orjson
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+
+# Datetimes are passed through to _default so they keep Flask's HTTP-date format
+_DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+def _default(o):
+    """Serialize the types Flask's default provider handles that orjson doesn't"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+def dumps_bytes(obj):
+    """Serialize obj to JSON bytes with orjson"""
+    return orjson.dumps(obj, default=_default, option=_DUMPS_OPTIONS)
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype="application/json")
@@ -4,29 +4,37 @@ SkillSwap API Server Runner
 Handles development and production server startup
 """
 
+import logging
 import os
 import sys
 from app import create_app
 
+log = logging.getLogger("skillswap")
+
 def main():
-    """Main server runner"""
-    app = create_app()
-    
-    if not app:
-        print("❌ Failed to create Flask application")
-        sys.exit(1)
-    
+    """Development server runner; production serves through gunicorn.conf.py"""
     # Get environment variables
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 5000))
     debug = os.getenv("FLASK_ENV", "development") == "development"
     
-    print("🚀 Starting SkillSwap API Server...")
-    print(f"📡 Server running at: http://{host}:{port}")
-    print(f"🔧 Debug mode: {debug}")
-    print(f"📋 API endpoints: http://{host}:{port}/api/*")
-    print(f"❤️  Health check: http://{host}:{port}/health")
-    print("=" * 50)
+    # Configured before create_app() so initialization messages use it too;
+    # outside debug only warnings and errors are written
+    logging.basicConfig(level=logging.INFO if debug else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    
+    app = create_app()
+    
+    if not app:
+        log.error("Failed to create Flask application")
+        sys.exit(1)
+    
+    # INFO, so the banner only shows in development
+    log.info("🚀 Starting SkillSwap API Server...")
+    log.info("📡 Server running at: http://%s:%s", host, port)
+    log.info("🔧 Debug mode: %s", debug)
+    log.info("📋 API endpoints: http://%s:%s/api/*", host, port)
+    log.info("❤️  Health check: http://%s:%s/health", host, port)
     
     try:
         app.run(
@@ -36,10 +44,10 @@ def main():
             threaded=True
         )
     except KeyboardInterrupt:
-        print("\n👋 Server stopped by user")
+        log.info("Server stopped by user")
     except Exception as e:
-        print(f"❌ Server error: {e}")
+        log.error("Server error: %s", e)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,132 @@
+"""
+Process pool for Firebase ID token verification
+RSA signature checks run in worker processes, so concurrent cold-cache
+verifications are not serialized on the web worker's GIL
+"""
+
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import firebase_admin
+import requests
+from firebase_admin import auth, credentials
+
+log = logging.getLogger(__name__)
+
+# Worker processes per web worker; 0 verifies inline on the request thread.
+# Every web worker gets its own pool, so the default splits the CPUs across
+# WEB_CONCURRENCY (gunicorn.conf.py's 2 x CPUs + 1 when unset) instead of
+# giving each worker a pool that alone could fill the machine
+_CPUS = os.cpu_count() or 1
+_WEB_WORKERS = int(os.getenv("WEB_CONCURRENCY", _CPUS * 2 + 1))
+VERIFY_PROCESSES = int(os.getenv("TOKEN_VERIFY_PROCESSES", min(4, max(1, _CPUS // _WEB_WORKERS))))
+VERIFY_TIMEOUT = 2
+# Spawning a worker, importing firebase_admin and fetching certs can take far longer than a verify
+WARM_TIMEOUT = 30
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+class VerifierUnavailable(Exception):
+    """The verifier pool is broken or overloaded; the token itself was never judged"""
+
+def install_cert_cache():
+    """Point this process's ID-token cert fetches at a disk cache shared by all processes; returns the fetcher"""
+    from cachecontrol import CacheControl
+    from cachecontrol.caches.file_cache import FileCache
+    from google.auth.transport import requests as google_requests
+    
+    cache_dir = os.getenv("FIREBASE_CERTS_CACHE_DIR",
+                          os.path.join(tempfile.gettempdir(), "firebase_certs"))
+    session = CacheControl(requests.Session(), cache=FileCache(cache_dir))
+    
+    # Google's Cache-Control max-age (~6h) decides when to refetch
+    cert_request = auth._get_client(firebase_admin.get_app())._token_verifier.request
+    cert_request._session = session
+    cert_request._delegate = google_requests.Request(session)
+    return cert_request
+
+def _init_worker(creds_path):
+    """Initialize Firebase Admin and the shared cert cache in a freshly spawned worker"""
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(creds_path))
+    try:
+        from firebase_admin._token_gen import ID_TOKEN_CERT_URI
+        install_cert_cache()(ID_TOKEN_CERT_URI)
+    except Exception as e:
+        # verify_id_token fetches the certs itself if this didn't work
+        log.warning("Token cert preload skipped in verifier: %s", e)
+
+def _ready():
+    """No-op run once per worker by warm()"""
+    return os.getpid()
+
+def _verify(token):
+    # Firebase auth errors don't survive pickling, so only the message goes back
+    try:
+        return auth.verify_id_token(token), None
+    except Exception as e:
+        return None, str(e)
+
+def _get_pool():
+    """Return this process's pool, creating it after startup or a fork"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            creds_path = os.getenv("FIREBASE_CREDENTIALS_PATH", "firebase-credentials.json")
+            _pool = ProcessPoolExecutor(
+                max_workers=VERIFY_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(os.path.abspath(creds_path),),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+def _discard_pool(pool):
+    """Drop a broken pool so the next call builds a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def warm():
+    """Start every verifier process now, so the first requests don't pay for spawning them"""
+    if VERIFY_PROCESSES <= 0:
+        return
+    pool = _get_pool()
+    try:
+        # No worker is idle yet, so each submit spawns one more process
+        for future in [pool.submit(_ready) for _ in range(VERIFY_PROCESSES)]:
+            future.result(timeout=WARM_TIMEOUT)
+    except BrokenProcessPool as e:
+        log.error("Token verifier pool failed to start: %s", e)
+        _discard_pool(pool)
+    except FutureTimeout:
+        log.warning("Token verifier pool still starting after %ss", WARM_TIMEOUT)
+
+def verify_id_token(token):
+    """Verify an ID token in the process pool, or inline when the pool is disabled"""
+    if VERIFY_PROCESSES <= 0:
+        return auth.verify_id_token(token)
+    
+    pool = _get_pool()
+    try:
+        decoded, error = pool.submit(_verify, token).result(timeout=VERIFY_TIMEOUT)
+    except BrokenProcessPool as e:
+        # A worker died or failed to initialize; rebuild on the next call instead of failing forever
+        log.error("Token verifier pool broken, rebuilding: %s", e)
+        _discard_pool(pool)
+        raise VerifierUnavailable("Token verifier restarting") from e
+    except FutureTimeout as e:
+        raise VerifierUnavailable("Token verifier busy") from e
+    if error:
+        raise ValueError(error)
+    return decoded